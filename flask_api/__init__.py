@@ -3,6 +3,8 @@ from flask import Flask
 from flask_cors import CORS
 from .config import Config
 from .db import init_app as init_db
+from .fields import init_app as init_fields
+from .metrics import init_app as init_metrics
 from .routes import bp as api_bp
 
 
@@ -16,10 +18,14 @@ def create_app(config_class=Config):
         resources={r"/api/*": {"origins": "*"}},
         supports_credentials=False,
         allow_headers=["Content-Type", "X-API-Key"],
+        expose_headers=["Content-Type"],
         methods=["GET", "POST", "OPTIONS"]
     )
 
+    # Histogram per route, log request lambat dan endpoint /metrics
+    init_metrics(app)
     init_db(app)
+    init_fields(app)
     app.register_blueprint(api_bp)
 
     @app.route("/health", methods=["GET"])
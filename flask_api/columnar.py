@@ -0,0 +1,197 @@
+# flask_api/columnar.py
+"""
+Format response kolom (?format=columnar / ?format=arrow) untuk client chart.
+
+columnar : {"columns": [...], "count": N, "data": {kolom: [nilai, ...]}}
+arrow    : Apache Arrow IPC stream (butuh paket pyarrow, di-import saat dipakai
+           supaya tidak menambah waktu import flask_api.wsgi)
+
+Field di dalam data_json bisa ikut diambil sebagai kolom sendiri lewat
+?json_fields=data.LDR,data.LED (path dipisah titik, dikirim sebagai parameter
+text[] ke operator #>, bukan disisipkan ke teks SQL).
+
+Hasil dibaca dari server-side cursor per FETCH_SIZE baris dan langsung
+ditranspose ke list per kolom, tanpa membuat dict per baris.
+"""
+import io
+import json
+import re
+from decimal import Decimal
+
+from flask import Response, jsonify, request
+
+FORMATS = ("rows", "columnar", "arrow")
+FETCH_SIZE = 2000
+MAX_JSON_FIELDS = 20
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+_PATH_RE = re.compile(r"^[A-Za-z0-9_\-]+$")
+
+
+def parse_format():
+    fmt = request.args.get("format", "rows")
+    if fmt not in FORMATS:
+        raise ValueError(f"format tidak dikenal: {fmt} (pilihan: {', '.join(FORMATS)})")
+    return fmt
+
+
+def parse_json_fields(columns):
+    """?json_fields=data.LDR,data.LED -> [("data.LDR", ["data", "LDR"]), ...]"""
+    raw = request.args.get("json_fields")
+    if not raw:
+        return []
+
+    fields = []
+    for name in raw.split(","):
+        name = name.strip()
+        if not name or any(name == n for n, _ in fields):
+            continue
+        path = name.split(".")
+        if not all(_PATH_RE.match(part) for part in path):
+            raise ValueError(f"json_fields tidak valid: {name}")
+        if name in columns:
+            raise ValueError(f"json_fields bentrok dengan nama kolom: {name}")
+        fields.append((name, path))
+
+    if len(fields) > MAX_JSON_FIELDS:
+        raise ValueError(f"json_fields maksimal {MAX_JSON_FIELDS}")
+    return fields
+
+
+def build_select(columns, json_fields):
+    """SELECT list + parameter (path data_json) yang harus berada di depan params WHERE."""
+    exprs = list(columns)
+    params = []
+    for _, path in json_fields:
+        exprs.append("data_json #> %s")
+        params.append(path)
+    return ", ".join(exprs), params
+
+
+def iter_column_batches(conn, sql, params):
+    """Yield (description, [kolom0_values, kolom1_values, ...]) per batch fetchmany."""
+    with conn.cursor(name="columnar") as cur:
+        cur.itersize = FETCH_SIZE
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            yield cur.description, [list(col) for col in zip(*rows)]
+
+
+def columnar_response(conn, sql, params, names):
+    data = {name: [] for name in names}
+    targets = [data[name] for name in names]
+    count = 0
+    for _, batch in iter_column_batches(conn, sql, params):
+        for target, values in zip(targets, batch):
+            target.extend(values)
+        count += len(batch[0])
+    return jsonify({"columns": list(names), "count": count, "data": data})
+
+
+# -----------------------
+# APACHE ARROW
+# -----------------------
+
+JSON_OIDS = (114, 3802)  # json, jsonb
+_INT64_MIN, _INT64_MAX = -(2 ** 63), 2 ** 63 - 1
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:  # format=arrow tidak tersedia
+        return None
+    return pyarrow
+
+
+def _as_float(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def _as_json_text(value):
+    return json.dumps(value, default=str)
+
+
+def _pg_arrow_types(pa):
+    # OID tipe PostgreSQL -> (tipe Arrow, konversi nilai Python atau None)
+    return {
+        16: (pa.bool_(), None),
+        20: (pa.int64(), None),
+        21: (pa.int16(), None),
+        23: (pa.int32(), None),
+        700: (pa.float32(), None),
+        701: (pa.float64(), None),
+        1700: (pa.float64(), _as_float),
+        25: (pa.string(), None),
+        1043: (pa.string(), None),
+        1114: (pa.timestamp("us"), None),
+        1184: (pa.timestamp("us", tz="UTC"), None),
+    }
+
+
+def _json_arrow_type(pa, columns):
+    """
+    Tipe Arrow untuk kolom json/jsonb (mis. json_fields=data.LDR) dari semua nilainya:
+    angka -> int64/float64, string -> string, boolean -> bool. Campuran tipe,
+    object dan array dikirim sebagai teks JSON (semua nilai di-encode sama).
+    """
+    seen = set()
+    for values in columns:
+        seen.update(type(v) for v in values if v is not None)
+    if not seen:
+        return pa.null(), None
+    if seen == {bool}:
+        return pa.bool_(), None
+    if seen == {int} and all(
+        _INT64_MIN <= v <= _INT64_MAX for values in columns for v in values if v is not None
+    ):
+        return pa.int64(), None
+    if seen <= {int, float}:
+        return pa.float64(), float
+    if seen == {str}:
+        return pa.string(), None
+    return pa.string(), _as_json_text
+
+
+def _arrow_array(pa, values, arrow_type, convert):
+    if convert is not None:
+        values = [convert(v) if v is not None else None for v in values]
+    return pa.array(values, type=arrow_type)
+
+
+def arrow_response(conn, sql, params, names):
+    pa = _import_pyarrow()
+    if pa is None:
+        return jsonify({"error": "format=arrow butuh paket pyarrow di server"}), 501
+
+    # Batch kolom dikumpulkan dulu (tetap tanpa dict per baris): tipe kolom JSON
+    # baru bisa ditentukan setelah semua nilainya terlihat, dan schema stream tetap.
+    description = None
+    batches = []
+    for description, batch in iter_column_batches(conn, sql, params):
+        batches.append(batch)
+
+    if description is None:
+        # Tanpa baris: tipe kolom tidak diketahui dari description -> schema string
+        mapping = [(pa.string(), None)] * len(names)
+    else:
+        types = _pg_arrow_types(pa)
+        mapping = []
+        for i, col in enumerate(description):
+            if col.type_code in JSON_OIDS:
+                mapping.append(_json_arrow_type(pa, [batch[i] for batch in batches]))
+            else:
+                # Tipe lain (mis. bytea, array) dikirim sebagai teks JSON
+                mapping.append(types.get(col.type_code, (pa.string(), _as_json_text)))
+
+    schema = pa.schema([(name, t) for name, (t, _) in zip(names, mapping)])
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches:
+            arrays = [_arrow_array(pa, values, t, conv) for values, (t, conv) in zip(batch, mapping)]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+    return Response(sink.getvalue(), mimetype=ARROW_MIMETYPE)
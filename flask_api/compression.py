@@ -0,0 +1,74 @@
+# flask_api/compression.py
+import gzip
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # brotli opsional; tanpa modul ini hanya gzip
+    brotli = None
+
+
+def accepted_encodings(header: str | None) -> set:
+    """Parse Accept-Encoding, abaikan encoding dengan q=0."""
+    accepted = set()
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(token)
+    return accepted
+
+
+def choose_encoding(accepted: set) -> str | None:
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def encode_body(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    # mtime=0 supaya output deterministik (ETag/cache)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_response(response):
+    """
+    after_request: kompres response JSON di atas COMPRESS_MIN_SIZE byte
+    dengan br (jika modul brotli terpasang) atau gzip sesuai Accept-Encoding.
+    """
+    cfg = current_app.config
+    if (
+        not cfg["COMPRESS_ENABLED"]
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype != "application/json"
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < cfg["COMPRESS_MIN_SIZE"]:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(accepted_encodings(request.headers.get("Accept-Encoding")))
+    if encoding is None:
+        return response
+
+    level = cfg["COMPRESS_BR_QUALITY"] if encoding == "br" else cfg["COMPRESS_GZIP_LEVEL"]
+    response.set_data(encode_body(data, encoding, level))
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -14,11 +14,52 @@ class Config:
     DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 
     DB_HOST = os.getenv("DB_HOST")
-    DB_PORT = int(os.getenv("DB_PORT"))
+    DB_PORT = int(os.getenv("DB_PORT", "5432"))
     DB_NAME = os.getenv("DB_NAME")
     DB_USER = os.getenv("DB_USER")
     DB_PASSWORD = os.getenv("DB_PASSWORD")
 
+    # Ukuran pool per proses worker (gthread / load test butuh > 1 koneksi)
+    DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+    DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+
+    # Read replica opsional untuk route read-only, DSN dipisah koma, contoh:
+    # DB_REPLICA_DSNS=host=10.0.0.2 dbname=iot user=api,host=10.0.0.3 dbname=iot user=api
+    DB_REPLICA_DSNS = [d.strip() for d in os.getenv("DB_REPLICA_DSNS", "").split(",") if d.strip()]
+    DB_REPLICA_MAX_LAG_S = float(os.getenv("DB_REPLICA_MAX_LAG_S", "30"))
+    DB_LATEST_MAX_LAG_S = float(os.getenv("DB_LATEST_MAX_LAG_S", "5"))
+    DB_REPLICA_CHECK_S = float(os.getenv("DB_REPLICA_CHECK_S", "5"))
+    DB_REPLICA_CONNECT_TIMEOUT = int(os.getenv("DB_REPLICA_CONNECT_TIMEOUT", "2"))
+
     API_KEY = os.getenv("API_KEY")
 
-    FLASK_PORT = int(os.getenv("FLASK_PORT"))
+    # Kompresi response JSON (br butuh paket brotli, fallback gzip)
+    COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "true").lower() == "true"
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+    COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+    COMPRESS_BR_QUALITY = int(os.getenv("COMPRESS_BR_QUALITY", "4"))
+
+    # Batas baris ?format=columnar / ?format=arrow (format rows tetap maks 500)
+    COLUMNAR_MAX_ROWS = int(os.getenv("COLUMNAR_MAX_ROWS", "5000"))
+    ARROW_MAX_ROWS = int(os.getenv("ARROW_MAX_ROWS", "100000"))
+
+    # Retensi bucket iot.device_link_stats; env yang sama dibaca ingestor (mqtt-to-postgres.py),
+    # jadi ?hours= di endpoint stats tidak bisa melebihi data yang disimpan
+    STATS_WINDOW_HOURS = int(os.getenv("STATS_WINDOW_HOURS", "24"))
+
+    # Field data_json yang dipromosikan ke kolom bertipe (lihat flask_api/fields.py)
+    PROMOTED_FIELDS_FILE = os.getenv("PROMOTED_FIELDS_FILE", str(BASE_DIR / "promoted_fields.json"))
+
+    # Broker MQTT untuk downlink (koneksi dibuka saat downlink pertama)
+    MQTT_HOST = os.getenv("MQTT_HOST")
+    MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+    MQTT_USER = os.getenv("MQTT_USER", os.getenv("MQTT_USERNAME"))
+    MQTT_PASS = os.getenv("MQTT_PASS", os.getenv("MQTT_PASSWORD"))
+
+    # Instrumentasi: endpoint /metrics (Prometheus, default mati; METRICS_TOKEN =
+    # wajib header Authorization: Bearer <token>) dan log request lambat (0 = nonaktif)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+    FLASK_PORT = int(os.getenv("FLASK_PORT", "5000"))
@@ -1,35 +1,246 @@
 # flask_api/db.py
-from flask import current_app, g
-from psycopg2.pool import SimpleConnectionPool
+import os
+import time
+import itertools
+import threading
 
-_pool: SimpleConnectionPool | None = None
+from flask import current_app, g, request
+from psycopg2 import OperationalError
+from psycopg2.pool import ThreadedConnectionPool
+
+from .metrics import InstrumentedConnection, record_phase
+
+_pool: ThreadedConnectionPool | None = None
+_pool_pid: int | None = None
+_pool_lock = threading.Lock()
+
+_replicas: list = []
+_replicas_pid: int | None = None
+_replica_rr = itertools.count()
+
+# Status replica: (in recovery?, pid WAL receiver, status WAL receiver, lag detik).
+# Lag 0 jika sudah replay semua WAL yang diterima; itu hanya benar selama WAL
+# receiver masih streaming, jadi status receiver ikut dicek di Replica.check().
+# Kolom status butuh role pg_read_all_stats (atau pg_monitor) di replica.
+REPLICA_LAG_SQL = """
+    SELECT
+        pg_is_in_recovery(),
+        (SELECT pid FROM pg_stat_wal_receiver),
+        (SELECT status FROM pg_stat_wal_receiver),
+        CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+"""
+
+
+def replica_lag(row) -> float:
+    """Lag dari hasil REPLICA_LAG_SQL; RuntimeError jika replica terputus dari primary."""
+    in_recovery, receiver_pid, receiver_status, lag = row
+    if in_recovery:
+        if receiver_pid is None:
+            raise RuntimeError("WAL receiver tidak aktif (terputus dari primary)")
+        if receiver_status is None:
+            raise RuntimeError("status WAL receiver tidak terbaca, grant pg_read_all_stats ke user API")
+        if receiver_status != "streaming":
+            raise RuntimeError(f"WAL receiver {receiver_status}, bukan streaming")
+    return float(lag)
+
+
+class Replica:
+    """Satu read replica: pool lazy + hasil health check terakhir."""
+
+    def __init__(self, name: str, dsn: str):
+        self.name = name
+        self.dsn = dsn
+        self.pool: ThreadedConnectionPool | None = None
+        self.healthy = False
+        self.lag: float | None = None
+        self.checked_at = 0.0
+        self.last_error: str | None = None
+        self.lock = threading.Lock()
+
+    def check(self, cfg):
+        """Health check + ukur lag, paling sering sekali per DB_REPLICA_CHECK_S."""
+        if time.monotonic() - self.checked_at < cfg["DB_REPLICA_CHECK_S"]:
+            return
+        # Thread lain sedang mengecek -> pakai status terakhir, jangan ikut menunggu
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if self.pool is None:
+                self.pool = ThreadedConnectionPool(
+                    minconn=cfg["DB_POOL_MIN"],
+                    maxconn=cfg["DB_POOL_MAX"],
+                    dsn=self.dsn,
+                    connect_timeout=cfg["DB_REPLICA_CONNECT_TIMEOUT"],
+                    connection_factory=InstrumentedConnection,
+                )
+            conn = self.pool.getconn()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(REPLICA_LAG_SQL)
+                    row = cur.fetchone()
+                conn.rollback()
+                self.pool.putconn(conn)
+            except Exception:
+                self.pool.putconn(conn, close=True)
+                raise
+            self.lag = replica_lag(row)
+            self.healthy = True
+            self.last_error = None
+        except Exception as e:
+            # Log sekali per jenis masalah, bukan tiap health check
+            if str(e) != self.last_error:
+                current_app.logger.warning("Replica %s tidak sehat: %s", self.name, e)
+                self.last_error = str(e)
+            self.healthy = False
+            self.lag = None
+        finally:
+            self.checked_at = time.monotonic()
+            self.lock.release()
+
+    def mark_unhealthy(self):
+        """Keluarkan dari rotasi sampai health check berikutnya (DB_REPLICA_CHECK_S)."""
+        self.healthy = False
+        self.lag = None
+        self.checked_at = time.monotonic()
 
 
 def init_app(app):
-    global _pool
-    if _pool is None:
-        _pool = SimpleConnectionPool(
-            minconn=1,
-            maxconn=10,
-            host=app.config["DB_HOST"],
-            port=app.config["DB_PORT"],
-            dbname=app.config["DB_NAME"],
-            user=app.config["DB_USER"],
-            password=app.config["DB_PASSWORD"],
-        )
+    # Pool tidak dibuat di sini: koneksi dibuka saat request pertama di tiap
+    # worker (setelah fork), lihat _get_pool().
+    app.extensions["db"] = True
 
     @app.teardown_appcontext
     def close_db(exception=None):
-        conn = g.pop("db_conn", None)
-        if conn is not None and _pool is not None:
-            _pool.putconn(conn)
+        _release_db()
+
+    @app.errorhandler(OperationalError)
+    def retry_on_primary(e):
+        # Fallback replica tidak hanya saat checkout: query GET yang gagal di replica
+        # (koneksi putus, conflict with recovery, ...) diulang sekali di primary
+        replica = g.get("db_replica")
+        if replica is None or request.method != "GET":
+            raise e
+        current_app.logger.warning("Query di %s gagal, ulangi di primary: %s", replica.name, e)
+        replica.mark_unhealthy()
+        _release_db(close=True)
+        g.db_force_primary = True
+        view = current_app.view_functions[request.endpoint]
+        return current_app.ensure_sync(view)(**request.view_args)
+
+    @app.after_request
+    def add_db_route_header(response):
+        # Memudahkan verifikasi routing primary/replica dari sisi client
+        route = g.get("db_route")
+        if route:
+            response.headers["X-DB-Route"] = route
+        return response
+
+
+def _release_db(close=False):
+    conn = g.pop("db_conn", None)
+    pool = g.pop("db_pool", None)
+    g.pop("db_replica", None)
+    if conn is not None and pool is not None:
+        pool.putconn(conn, close=close or bool(conn.closed))
 
 
-def get_db():
-    global _pool
-    if _pool is None:
+def _get_pool() -> ThreadedConnectionPool:
+    global _pool, _pool_pid
+
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            cfg = current_app.config
+            _pool = ThreadedConnectionPool(
+                minconn=cfg["DB_POOL_MIN"],
+                maxconn=cfg["DB_POOL_MAX"],
+                host=cfg["DB_HOST"],
+                port=cfg["DB_PORT"],
+                dbname=cfg["DB_NAME"],
+                user=cfg["DB_USER"],
+                password=cfg["DB_PASSWORD"],
+                connection_factory=InstrumentedConnection,
+            )
+            _pool_pid = pid
+
+    return _pool
+
+
+def _get_replicas() -> list:
+    global _replicas, _replicas_pid
+
+    pid = os.getpid()
+    if _replicas_pid != pid:
+        with _pool_lock:
+            if _replicas_pid != pid:
+                _replicas = [
+                    Replica(f"replica{i + 1}", dsn)
+                    for i, dsn in enumerate(current_app.config["DB_REPLICA_DSNS"])
+                ]
+                _replicas_pid = pid
+    return _replicas
+
+
+def _pick_replica(max_lag: float):
+    """Round-robin di antara replica sehat dengan lag <= max_lag."""
+    replicas = _get_replicas()
+    if not replicas:
+        return None
+
+    cfg = current_app.config
+    start = next(_replica_rr)
+    for i in range(len(replicas)):
+        replica = replicas[(start + i) % len(replicas)]
+        replica.check(cfg)
+        if replica.healthy and replica.lag is not None and replica.lag <= max_lag:
+            return replica
+    return None
+
+
+def get_db(readonly: bool = False, max_lag: float | None = None):
+    """
+    Koneksi DB untuk request ini (satu koneksi per request).
+
+    readonly=True boleh dilayani read replica (DB_REPLICA_DSNS) yang lag-nya
+    <= max_lag detik (default DB_REPLICA_MAX_LAG_S). max_lag=0 memaksa primary.
+    Jika tidak ada replica yang memenuhi, otomatis fallback ke primary; query GET
+    yang gagal di replica diulang di primary oleh retry_on_primary.
+    """
+    if "db" not in current_app.extensions:
         raise RuntimeError("Database pool belum diinisialisasi. Panggil init_app(app) dulu.")
 
-    if "db_conn" not in g:
-        g.db_conn = _pool.getconn()
+    if "db_conn" in g:
+        return g.db_conn
+
+    if max_lag is None:
+        max_lag = current_app.config["DB_REPLICA_MAX_LAG_S"]
+
+    if readonly and max_lag > 0 and not g.get("db_force_primary"):
+        replica = _pick_replica(max_lag)
+        if replica is not None:
+            try:
+                t0 = time.perf_counter()
+                g.db_conn = replica.pool.getconn()
+                record_phase("pool", time.perf_counter() - t0)
+                g.db_pool = replica.pool
+                g.db_replica = replica
+                g.db_route = replica.name
+                return g.db_conn
+            except Exception as e:
+                current_app.logger.warning("Replica %s gagal, fallback ke primary: %s", replica.name, e)
+                replica.mark_unhealthy()
+
+    t0 = time.perf_counter()
+    pool = _get_pool()
+    g.db_conn = pool.getconn()
+    record_phase("pool", time.perf_counter() - t0)
+    g.db_pool = pool
+    g.db_route = "primary"
     return g.db_conn
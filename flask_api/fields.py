@@ -0,0 +1,218 @@
+# flask_api/fields.py
+"""
+Field data_json yang "dipromosikan" menjadi generated column bertipe di
+iot.uplinks, supaya filter seperti ?field=LDR&gt=100 bisa memakai index.
+
+Konfigurasi (PROMOTED_FIELDS_FILE, default promoted_fields.json di root):
+{
+  "fields": [
+    {"name": "LDR", "path": ["data", "LDR"], "type": "numeric", "apps": ["LabElektro"]}
+  ]
+}
+
+- name   : nama yang dipakai client di ?field=
+- path   : path di data_json
+- type   : numeric | text | boolean
+- apps   : (opsional) hanya diisi untuk aplikasi ini
+- column : (opsional) nama kolom, default f_<name lowercase>
+
+DDL dibuat oleh tools/promote_fields.py. Nama field dari user hanya dipakai
+sebagai key lookup; teks SQL selalu berasal dari konfigurasi yang sudah divalidasi.
+"""
+import re
+import json
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from flask import current_app, request
+
+
+class PromotedFieldsError(Exception):
+    """promoted_fields.json tidak valid (kesalahan konfigurasi server, bukan request)."""
+
+
+def _to_numeric(raw: str) -> Decimal:
+    # Decimal, bukan float: presisi sama dengan kolom numeric; nan/inf ditolak
+    try:
+        value = Decimal(raw)
+    except InvalidOperation:
+        raise ValueError(raw)
+    if not value.is_finite():
+        raise ValueError(raw)
+    return value
+
+
+FIELD_TYPES = {
+    # type -> (tipe SQL, jsonb_typeof yang diterima, konversi nilai query)
+    "numeric": ("numeric", "number", _to_numeric),
+    "text": ("text", None, str),
+    "boolean": ("boolean", "boolean", lambda v: {"true": True, "false": False}[v.lower()]),
+}
+
+FILTER_OPS = {
+    "gt": ">",
+    "gte": ">=",
+    "lt": "<",
+    "lte": "<=",
+    "eq": "=",
+    "ne": "<>",
+}
+
+_IDENT_RE = re.compile(r"^[a-z_][a-z0-9_]{0,62}$")
+_PATH_RE = re.compile(r"^[A-Za-z0-9_\-]+$")
+
+_cache: dict = {}
+# Kolom promosi yang sudah terbukti ada di iot.uplinks (per proses). Kolom yang
+# belum ada dicek ulang setiap dipakai, jadi promote_fields --apply tanpa restart API.
+_existing_columns: set = set()
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def load_promoted_fields(path) -> dict:
+    """
+    Baca dan validasi konfigurasi. Mengembalikan {name: field_dict}.
+    Melempar PromotedFieldsError jika file tidak valid.
+    """
+    path = Path(path)
+    if not path.exists():
+        return {}
+
+    try:
+        with open(path) as f:
+            entries = json.load(f).get("fields", [])
+    except (OSError, ValueError, AttributeError) as e:
+        raise PromotedFieldsError(f"{path}: {e}")
+
+    fields = {}
+    for entry in entries:
+        name = entry.get("name") if isinstance(entry, dict) else None
+        if not name:
+            raise PromotedFieldsError(f"{path}: setiap field wajib punya name: {entry!r}")
+        ftype = entry.get("type", "numeric")
+        if ftype not in FIELD_TYPES:
+            raise PromotedFieldsError(f"promoted field {name}: type tidak didukung: {ftype}")
+
+        column = entry.get("column") or "f_" + re.sub(r"[^a-z0-9_]", "_", name.lower())
+        if not _IDENT_RE.match(column):
+            raise PromotedFieldsError(f"promoted field {name}: nama kolom tidak valid: {column}")
+
+        json_path = entry.get("path") or [name]
+        for part in json_path:
+            if not _PATH_RE.match(str(part)):
+                raise PromotedFieldsError(f"promoted field {name}: path tidak valid: {json_path}")
+
+        fields[name] = {
+            "name": name,
+            "column": column,
+            "type": ftype,
+            "path": [str(p) for p in json_path],
+            "apps": list(entry.get("apps") or []),
+        }
+    return fields
+
+
+def init_app(app):
+    """Muat dan validasi konfigurasi saat create_app: file rusak gagal saat start, bukan jadi 400."""
+    path = app.config["PROMOTED_FIELDS_FILE"]
+    _cache[path] = load_promoted_fields(path)
+
+
+def get_promoted_fields() -> dict:
+    path = current_app.config["PROMOTED_FIELDS_FILE"]
+    if path not in _cache:
+        _cache[path] = load_promoted_fields(path)
+    return _cache[path]
+
+
+def generated_column_expr(field: dict) -> str:
+    """Ekspresi generated column (immutable) untuk satu field."""
+    sql_type, json_type, _ = FIELD_TYPES[field["type"]]
+    path = _sql_literal("{" + ",".join(field["path"]) + "}")
+
+    conditions = []
+    if json_type:
+        conditions.append(f"jsonb_typeof(data_json #> {path}) = '{json_type}'")
+    if field["apps"]:
+        apps = ", ".join(_sql_literal(a) for a in field["apps"])
+        conditions.append(f"app_name IN ({apps})")
+
+    value = f"(data_json #>> {path})::{sql_type}"
+    if not conditions:
+        return value
+    return f"CASE WHEN {' AND '.join(conditions)} THEN {value} END"
+
+
+def field_ddl(field: dict) -> list:
+    """DDL untuk generated column + index (upper(dev_eui), kolom)."""
+    column = field["column"]
+    sql_type = FIELD_TYPES[field["type"]][0]
+    return [
+        f"ALTER TABLE iot.uplinks ADD COLUMN IF NOT EXISTS {column} {sql_type} "
+        f"GENERATED ALWAYS AS ({generated_column_expr(field)}) STORED",
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS uplinks_{column}_idx "
+        f"ON iot.uplinks (UPPER(dev_eui), {column}) WHERE {column} IS NOT NULL",
+    ]
+
+
+def column_exists(conn, column: str) -> bool:
+    """Apakah generated column sudah dibuat (tools.promote_fields --apply)."""
+    if column in _existing_columns:
+        return True
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = 'iot' AND table_name = 'uplinks' AND column_name = %s
+            """,
+            (column,),
+        )
+        found = cur.fetchone() is not None
+    if found:
+        _existing_columns.add(column)
+    return found
+
+
+def build_field_where_clause(params, conn):
+    """
+    Filter ?field=<name>&gt=..&lt=.. menjadi predicate pada kolom promosi.
+    Melempar ValueError (-> 400) untuk field/operator/nilai yang tidak valid,
+    termasuk field yang kolomnya belum dibuat di database.
+    """
+    name = request.args.get("field")
+    ops = [op for op in FILTER_OPS if op in request.args]
+
+    if not name:
+        if ops:
+            raise ValueError("Parameter field wajib diisi untuk filter " + "/".join(FILTER_OPS))
+        return ""
+
+    fields = get_promoted_fields()
+    field = fields.get(name)
+    if field is None:
+        choices = ", ".join(sorted(fields)) or "-"
+        raise ValueError(f"field tidak dikenal: {name} (pilihan: {choices})")
+    if not ops:
+        raise ValueError("Filter field butuh minimal satu dari: " + ", ".join(FILTER_OPS))
+    if not column_exists(conn, field["column"]):
+        current_app.logger.warning(
+            "Kolom promosi %s untuk field %s belum ada; jalankan python -m tools.promote_fields --apply",
+            field["column"], name,
+        )
+        raise ValueError(f"field {name} belum tersedia untuk filter di database ini")
+
+    sql_type, _, convert = FIELD_TYPES[field["type"]]
+    where_parts = []
+    for op in ops:
+        raw = request.args.get(op)
+        try:
+            value = convert(raw)
+        except (ValueError, KeyError):
+            raise ValueError(f"Nilai {op} tidak valid untuk field {name} ({field['type']}): {raw}")
+        # Cast eksplisit supaya perbandingan tetap pada tipe kolom (index terpakai)
+        where_parts.append(f"{field['column']} {FILTER_OPS[op]} %s::{sql_type}")
+        params.append(value)
+
+    return " AND " + " AND ".join(where_parts)
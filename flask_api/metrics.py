@@ -0,0 +1,256 @@
+# flask_api/metrics.py
+"""
+Instrumentasi per route tanpa dependency tambahan, diekspor di /metrics
+(format teks Prometheus).
+
+Fase yang diukur per request (label route = pola URL, mis. /api/uplinks/<dev_eui>):
+  - pool      : checkout koneksi di get_db (getconn)
+  - query     : cursor.execute
+  - fetch     : fetchone/fetchmany/fetchall
+  - serialize : dumps JSON (jsonify)
+ditambah total durasi, jumlah baris yang di-fetch dan ukuran body response
+(setelah kompresi).
+
+Query dan fetch diukur oleh InstrumentedConnection, dipasang sebagai
+connection_factory pool di db.py, jadi route tidak perlu diubah.
+Request di atas SLOW_REQUEST_MS dicatat ke log beserta SQL dan rincian waktunya.
+
+Histogram disimpan per proses: dengan beberapa worker gunicorn, tiap scrape
+hanya melihat worker yang melayaninya.
+
+/metrics hanya aktif jika METRICS_ENABLED=true. Jika METRICS_TOKEN diisi,
+scrape wajib mengirim header Authorization: Bearer <token>.
+"""
+import re
+import hmac
+import time
+import bisect
+import threading
+
+from flask import Response, g, has_request_context, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from psycopg2.extensions import connection as _pg_connection
+from psycopg2.extensions import cursor as _pg_cursor
+
+PREFIX = "lorawanums_api"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+MAX_SQL_PER_REQUEST = 20
+
+_WS_RE = re.compile(r"\s+")
+
+
+class Histogram:
+    """Histogram kumulatif ala Prometheus, dengan label, thread-safe."""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._series.items())
+        for label_values, (counts, total, n) in items:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {n}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {n}")
+        return "\n".join(lines)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    f"{PREFIX}_request_duration_seconds", "Durasi total request", ("method", "route", "status"), LATENCY_BUCKETS
+)
+PHASE_SECONDS = Histogram(
+    f"{PREFIX}_phase_duration_seconds", "Durasi per fase (pool, query, fetch, serialize) per request",
+    ("route", "phase"), LATENCY_BUCKETS,
+)
+ROWS = Histogram(f"{PREFIX}_rows_fetched", "Baris yang di-fetch dari DB per request", ("route",), ROW_BUCKETS)
+RESPONSE_BYTES = Histogram(
+    f"{PREFIX}_response_bytes", "Ukuran body response (setelah kompresi)", ("route",), BYTE_BUCKETS
+)
+HISTOGRAMS = (REQUEST_SECONDS, PHASE_SECONDS, ROWS, RESPONSE_BYTES)
+
+
+# -----------------------
+# STATE PER REQUEST
+# -----------------------
+
+def _current():
+    if not has_request_context():
+        return None
+    return g.get("metrics")
+
+
+def record_phase(phase, seconds):
+    """Tambahkan waktu ke fase request ini (no-op di luar request)."""
+    state = _current()
+    if state is not None:
+        state["phases"][phase] = state["phases"].get(phase, 0.0) + seconds
+
+
+def normalize_sql(sql):
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    return _WS_RE.sub(" ", str(sql)).strip()[:500]
+
+
+# -----------------------
+# DB: CONNECTION / CURSOR
+# -----------------------
+
+class _TimedCursorMixin:
+    def execute(self, query, vars=None):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - t0
+            state = _current()
+            if state is not None:
+                state["phases"]["query"] = state["phases"].get("query", 0.0) + elapsed
+                if len(state["sql"]) < MAX_SQL_PER_REQUEST:
+                    state["sql"].append((query, elapsed))
+
+    def _timed_fetch(self, fetch, *args):
+        t0 = time.perf_counter()
+        result = fetch(*args)
+        elapsed = time.perf_counter() - t0
+        state = _current()
+        if state is not None:
+            state["phases"]["fetch"] = state["phases"].get("fetch", 0.0) + elapsed
+            if isinstance(result, list):
+                state["rows"] += len(result)
+            elif result is not None:
+                state["rows"] += 1
+        return result
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._timed_fetch(super().fetchmany)
+        return self._timed_fetch(super().fetchmany, size)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+_cursor_classes = {}
+
+
+def _timed_cursor_class(factory):
+    cls = _cursor_classes.get(factory)
+    if cls is None:
+        cls = _cursor_classes[factory] = type("Timed" + factory.__name__, (_TimedCursorMixin, factory), {})
+    return cls
+
+
+class InstrumentedConnection(_pg_connection):
+    """Connection yang semua cursor-nya (termasuk cursor_factory=RealDictCursor) terukur."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get("cursor_factory") or self.cursor_factory or _pg_cursor
+        kwargs["cursor_factory"] = _timed_cursor_class(factory)
+        return super().cursor(*args, **kwargs)
+
+
+# -----------------------
+# SERIALISASI JSON
+# -----------------------
+
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            record_phase("serialize", time.perf_counter() - t0)
+
+
+# -----------------------
+# FLASK HOOKS
+# -----------------------
+
+def init_app(app):
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_metrics():
+        g.metrics = {"start": time.perf_counter(), "phases": {}, "sql": [], "rows": 0}
+
+    @app.after_request
+    def measure_response(response):
+        state = _current()
+        if state is not None and not response.is_streamed:
+            # Hook blueprint (kompresi) sudah jalan: ini ukuran body yang dikirim
+            state["bytes"] = response.content_length
+            state["status"] = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_metrics(exception=None):
+        state = g.pop("metrics", None)
+        if state is None:
+            return
+        total = time.perf_counter() - state["start"]
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        status = state.get("status", 500)
+
+        REQUEST_SECONDS.observe((request.method, route, str(status)), total)
+        for phase, seconds in state["phases"].items():
+            PHASE_SECONDS.observe((route, phase), seconds)
+        if "query" in state["phases"]:
+            ROWS.observe((route,), state["rows"])
+        if state.get("bytes") is not None:
+            RESPONSE_BYTES.observe((route,), state["bytes"])
+
+        slow_ms = app.config["SLOW_REQUEST_MS"]
+        if slow_ms and total * 1000 >= slow_ms:
+            breakdown = " ".join(f"{p}={s * 1000:.1f}ms" for p, s in sorted(state["phases"].items()))
+            statements = "\n".join(
+                f"  [{s * 1000:.1f}ms] {normalize_sql(sql)}" for sql, s in state["sql"]
+            )
+            app.logger.warning(
+                "Slow request %s %s %s: %.1fms (%s) rows=%d bytes=%s\n%s",
+                request.method, route, status, total * 1000, breakdown or "-",
+                state["rows"], state.get("bytes"), statements or "  (tanpa SQL)",
+            )
+
+    if app.config["METRICS_ENABLED"]:
+        @app.route("/metrics", methods=["GET"])
+        def metrics():
+            token = app.config.get("METRICS_TOKEN")
+            if token:
+                provided = request.headers.get("Authorization", "")
+                if not hmac.compare_digest(provided.encode(), f"Bearer {token}".encode()):
+                    return jsonify({"error": "Unauthorized"}), 401
+            body = "\n".join(h.render() for h in HISTOGRAMS) + "\n"
+            return Response(body, mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,47 @@
+# flask_api/mqtt_client.py
+import os
+import threading
+
+from flask import current_app
+
+_client = None
+_client_pid: int | None = None
+_lock = threading.Lock()
+
+
+def get_mqtt_client():
+    """
+    Client MQTT untuk downlink, dibuat saat pertama dipakai.
+
+    Tidak ada koneksi saat import / create_app, sehingga worker gunicorn
+    boot cepat walau broker mati, dan hanya worker yang benar-benar mengirim
+    downlink yang memegang socket ke broker. PID dicek supaya client yang
+    terbawa dari proses parent (fork) tidak dipakai ulang.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _lock:
+        if _client is None or _client_pid != pid:
+            import paho.mqtt.client as mqtt
+
+            host = current_app.config.get("MQTT_HOST")
+            if not host:
+                raise RuntimeError("MQTT_HOST belum dikonfigurasi")
+
+            client = mqtt.Client()
+            if current_app.config.get("MQTT_USER"):
+                client.username_pw_set(
+                    current_app.config["MQTT_USER"],
+                    current_app.config.get("MQTT_PASS"),
+                )
+            client.connect(host, current_app.config["MQTT_PORT"], keepalive=30)
+            # Thread network milik paho, termasuk auto-reconnect
+            client.loop_start()
+
+            _client, _client_pid = client, pid
+
+    return _client
@@ -1,38 +1,40 @@
 # flask_api/routes.py
-import os
 import json
+import time
 import binascii
-import threading
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from psycopg2.extras import RealDictCursor
-import paho.mqtt.client as mqtt
 
 from .auth import require_api_key
+from .columnar import arrow_response, build_select, columnar_response, parse_format, parse_json_fields
+from .compression import compress_response
 from .db import get_db
+from .fields import build_field_where_clause
+from .mqtt_client import get_mqtt_client
 
 bp = Blueprint("api", __name__)
-
-# -----------------------
-# KONFIGURASI MQTT
-# -----------------------
-
-MQTT_HOST = os.getenv("MQTT_HOST", "192.168.0.232")
-MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
-MQTT_USER = os.getenv("MQTT_USER", "wisgate")
-MQTT_PASS = os.getenv("MQTT_PASS", "lorawanums")
-
-mqtt_client = mqtt.Client()
-mqtt_client.username_pw_set(MQTT_USER, MQTT_PASS)
-
-
-def run_mqtt():
-    mqtt_client.connect(MQTT_HOST, MQTT_PORT, keepalive=30)
-    mqtt_client.loop_forever()
-
-
-# Jalankan MQTT loop di background thread
-threading.Thread(target=run_mqtt, daemon=True).start()
+bp.after_request(compress_response)
+
+# Kolom yang boleh dipilih lewat ?fields= (urutan = urutan default SELECT)
+COMPACT_COLUMNS = (
+    "uplink_id",
+    "inserted_at",
+    "app_name",
+    "dev_eui",
+    "device_name",
+    "ts",
+    "fcnt",
+    "fport",
+    "data_hex",
+    "data_text",
+    "data_json",
+    "rssi_dbm",
+    "snr_db",
+    "dr",
+    "freq_hz",
+)
+FULL_COLUMNS = COMPACT_COLUMNS[:2] + ("app_id",) + COMPACT_COLUMNS[2:] + ("raw",)
 
 
 # -----------------------
@@ -46,7 +48,7 @@ def normalize_dev_eui(dev_eui: str) -> str:
     return dev_eui.upper()
 
 
-def parse_pagination():
+def parse_pagination(maximum=500):
     try:
         limit = int(request.args.get("limit", 50))
     except ValueError:
@@ -56,11 +58,75 @@ def parse_pagination():
     except ValueError:
         offset = 0
 
-    limit = max(1, min(limit, 500))
+    limit = max(1, min(limit, maximum))
     offset = max(0, offset)
     return limit, offset
 
 
+def parse_fields(allowed):
+    """
+    Proyeksi kolom ?fields=ts,data_json, divalidasi terhadap whitelist.
+    Tanpa parameter -> semua kolom allowed.
+    """
+    raw = request.args.get("fields")
+    if not raw:
+        return list(allowed)
+
+    fields = []
+    for name in raw.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in allowed:
+            raise ValueError(f"fields tidak dikenal: {name} (pilihan: {', '.join(allowed)})")
+        if name not in fields:
+            fields.append(name)
+
+    if not fields:
+        raise ValueError("fields tidak boleh kosong")
+    return fields
+
+
+def parse_max_lag(default=None):
+    """
+    Freshness per request untuk routing read replica:
+      ?consistency=primary -> selalu primary
+      ?max_lag=<detik>     -> replica hanya jika lag <= nilai ini
+    """
+    if request.args.get("consistency") == "primary":
+        return 0.0
+    try:
+        return max(0.0, float(request.args["max_lag"]))
+    except (KeyError, ValueError):
+        return default
+
+
+def parse_output(columns):
+    """
+    ?format= dan ?json_fields= untuk list route.
+    Mengembalikan (format, json_fields, batas baris maksimal).
+    """
+    fmt = parse_format()
+    if fmt == "rows":
+        return fmt, [], 500
+    cfg = current_app.config
+    max_rows = cfg["ARROW_MAX_ROWS"] if fmt == "arrow" else cfg["COLUMNAR_MAX_ROWS"]
+    return fmt, parse_json_fields(columns), max_rows
+
+
+def render_rows(conn, sql, params, fmt, names):
+    """Jalankan query list dan render sesuai ?format=."""
+    if fmt == "columnar":
+        return columnar_response(conn, sql, params, names)
+    if fmt == "arrow":
+        return arrow_response(conn, sql, params, names)
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    return jsonify(rows)
+
+
 def parse_time_filter():
     ts_from = request.args.get("from")
     ts_to = request.args.get("to")
@@ -96,6 +162,107 @@ def to_hex(value):
     return binascii.hexlify(b).decode("ascii").upper()
 
 
+def parse_window_hours():
+    """?hours= untuk endpoint stats, dibatasi retensi bucket STATS_WINDOW_HOURS."""
+    maximum = current_app.config["STATS_WINDOW_HOURS"]
+    try:
+        hours = int(request.args.get("hours", maximum))
+    except ValueError:
+        hours = maximum
+    return max(1, min(hours, maximum))
+
+
+def _loss(received, expected):
+    lost = max(0, expected - received)
+    return lost, (lost / expected if expected else None)
+
+
+def summarize_link_stats(row, hours):
+    """Ringkas satu baris iot.device_link_stats untuk window N jam terakhir."""
+    oldest = int(time.time()) // 3600 * 3600 - (hours - 1) * 3600
+    buckets = [b for b in (row["windows"] or []) if b["t"] >= oldest]
+
+    received = sum(b["rx"] for b in buckets)
+    expected = sum(b["exp"] for b in buckets)
+    lost, loss_ratio = _loss(received, expected)
+
+    def metric(name):
+        aggs = [b[name] for b in buckets if b.get(name)]
+        hist = {}
+        for b in buckets:
+            for key, n in (b.get(name + "_h") or {}).items():
+                hist[key] = hist.get(key, 0) + n
+        samples = sum(hist.values())
+        return {
+            "avg": round(sum(a[0] for a in aggs) / samples, 2) if samples else None,
+            "min": min(a[1] for a in aggs) if aggs else None,
+            "max": max(a[2] for a in aggs) if aggs else None,
+            "histogram": dict(sorted(hist.items(), key=lambda kv: float(kv[0]))),
+        }
+
+    dr_hist = {}
+    for b in buckets:
+        for key, n in (b.get("dr") or {}).items():
+            dr_hist[key] = dr_hist.get(key, 0) + n
+
+    total_lost, total_loss_ratio = _loss(row["frames_received"], row["frames_expected"])
+    return {
+        "dev_eui": row["dev_eui"],
+        "app_name": row["app_name"],
+        "last_fcnt": row["last_fcnt"],
+        "last_ts": row["last_ts"],
+        "updated_at": row["updated_at"],
+        "total": {
+            "received": row["frames_received"],
+            "expected": row["frames_expected"],
+            "lost": total_lost,
+            "loss_ratio": total_loss_ratio,
+            "fcnt_resets": row["fcnt_resets"],
+        },
+        "window": {
+            "hours": hours,
+            "received": received,
+            "expected": expected,
+            "lost": lost,
+            "loss_ratio": loss_ratio,
+            "rssi": metric("rssi"),
+            "snr": metric("snr"),
+            "dr": dict(sorted(dr_hist.items(), key=lambda kv: int(kv[0]))),
+        },
+    }
+
+
+# -----------------------
+# SQL
+# -----------------------
+# Bentuk query di bawah juga diperiksa plan-nya oleh tools/plan_check.py;
+# ubah di sini, bukan di dalam route.
+
+DEVICES_SQL = """
+    SELECT UPPER(dev_eui) AS dev_eui, COUNT(*) AS uplink_count
+    FROM iot.uplinks
+    GROUP BY UPPER(dev_eui)
+    ORDER BY dev_eui
+"""
+
+
+def build_uplinks_sql(select_list, where_clause="", limit_clause="LIMIT %s OFFSET %s"):
+    """
+    Query uplink per device, terbaru dulu. Parameter: dev_eui (uppercase),
+    parameter where_clause, lalu parameter limit_clause.
+    Dilayani index uplinks_dev_eui_ts_idx (sql/003_uplinks_read_indexes.sql).
+    """
+    return f"""
+        SELECT
+            {select_list}
+        FROM iot.uplinks
+        WHERE UPPER(dev_eui) = %s
+        {where_clause}
+        ORDER BY ts DESC NULLS LAST, inserted_at DESC
+        {limit_clause}
+    """
+
+
 # ------------------------------------------------
 # UPLINKS - LIST DEVICES (overview & debugging)
 # ------------------------------------------------
@@ -104,16 +271,9 @@ def to_hex(value):
 @require_api_key
 def list_uplink_devices():
     """Daftar dev_eui yang memiliki data uplink dan jumlah paketnya."""
-    conn = get_db()
-    sql = """
-        SELECT UPPER(dev_eui) AS dev_eui, COUNT(*) AS uplink_count
-        FROM iot.uplinks
-        GROUP BY UPPER(dev_eui)
-        ORDER BY dev_eui;
-    """
-
+    conn = get_db(readonly=True, max_lag=parse_max_lag())
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(sql)
+        cur.execute(DEVICES_SQL)
         rows = cur.fetchall()
 
     return jsonify(rows)
@@ -131,43 +291,28 @@ def list_uplinks_compact(dev_eui):
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
-    limit, offset = parse_pagination()
+    try:
+        columns = parse_fields(COMPACT_COLUMNS)
+        fmt, json_fields, max_rows = parse_output(columns)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    select_list, params = build_select(columns, json_fields)
+    limit, offset = parse_pagination(maximum=max_rows)
     ts_from, ts_to = parse_time_filter()
 
-    conn = get_db()
-    params = [dev_eui]
+    params.append(dev_eui)
     where_clause = build_ts_where_clause(ts_from, ts_to, params)
+    conn = get_db(readonly=True, max_lag=parse_max_lag())
+    try:
+        where_clause += build_field_where_clause(params, conn)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    sql = f"""
-        SELECT
-            uplink_id,
-            inserted_at,
-            app_name,
-            dev_eui,
-            device_name,
-            ts,
-            fcnt,
-            fport,
-            data_hex,
-            data_text,
-            data_json,
-            rssi_dbm,
-            snr_db,
-            dr,
-            freq_hz
-        FROM iot.uplinks
-        WHERE UPPER(dev_eui) = %s
-        {where_clause}
-        ORDER BY ts DESC NULLS LAST, inserted_at DESC
-        LIMIT %s OFFSET %s
-    """
+    sql = build_uplinks_sql(select_list, where_clause)
     params.extend([limit, offset])
 
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(sql, params)
-        rows = cur.fetchall()
-
-    return jsonify(rows)
+    return render_rows(conn, sql, params, fmt, columns + [n for n, _ in json_fields])
 
 
 @bp.route("/api/uplinks/<dev_eui>/latest", methods=["GET"])
@@ -178,29 +323,13 @@ def latest_uplink_compact(dev_eui):
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
-    conn = get_db()
-    sql = """
-        SELECT
-            uplink_id,
-            inserted_at,
-            app_name,
-            dev_eui,
-            device_name,
-            ts,
-            fcnt,
-            fport,
-            data_hex,
-            data_text,
-            data_json,
-            rssi_dbm,
-            snr_db,
-            dr,
-            freq_hz
-        FROM iot.uplinks
-        WHERE UPPER(dev_eui) = %s
-        ORDER BY ts DESC NULLS LAST, inserted_at DESC
-        LIMIT 1
-    """
+    try:
+        select_list = ", ".join(parse_fields(COMPACT_COLUMNS))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db(readonly=True, max_lag=parse_max_lag(current_app.config["DB_LATEST_MAX_LAG_S"]))
+    sql = build_uplinks_sql(select_list, limit_clause="LIMIT 1")
 
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
         cur.execute(sql, (dev_eui,))
@@ -225,34 +354,25 @@ def last_10_uplinks(dev_eui):
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
-    last_n = parse_last_n(default=10, maximum=500)
+    try:
+        columns = parse_fields(COMPACT_COLUMNS)
+        fmt, json_fields, max_rows = parse_output(columns)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    conn = get_db()
-    sql = """
-        SELECT
-            uplink_id,
-            inserted_at,
-            app_name,
-            dev_eui,
-            device_name,
-            ts,
-            fcnt,
-            fport,
-            data_hex,
-            data_text,
-            data_json,
-            rssi_dbm,
-            snr_db,
-            dr,
-            freq_hz
-        FROM iot.uplinks
-        WHERE UPPER(dev_eui) = %s
-        ORDER BY ts DESC NULLS LAST, inserted_at DESC
-        LIMIT %s
-    """
+    select_list, params = build_select(columns, json_fields)
+    last_n = parse_last_n(default=10, maximum=max_rows)
+
+    conn = get_db(readonly=True, max_lag=parse_max_lag())
+    sql = build_uplinks_sql(select_list, limit_clause="LIMIT %s")
+
+    params.extend([dev_eui, last_n])
+
+    if fmt != "rows":
+        return render_rows(conn, sql, params, fmt, columns + [n for n, _ in json_fields])
 
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(sql, (dev_eui, last_n))
+        cur.execute(sql, params)
         rows = cur.fetchall()
 
     if not rows:
@@ -273,45 +393,28 @@ def list_uplinks_full(dev_eui):
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
-    limit, offset = parse_pagination()
+    try:
+        columns = parse_fields(FULL_COLUMNS)
+        fmt, json_fields, max_rows = parse_output(columns)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    select_list, params = build_select(columns, json_fields)
+    limit, offset = parse_pagination(maximum=max_rows)
     ts_from, ts_to = parse_time_filter()
 
-    conn = get_db()
-    params = [dev_eui]
+    params.append(dev_eui)
     where_clause = build_ts_where_clause(ts_from, ts_to, params)
+    conn = get_db(readonly=True, max_lag=parse_max_lag())
+    try:
+        where_clause += build_field_where_clause(params, conn)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    sql = f"""
-        SELECT
-            uplink_id,
-            inserted_at,
-            app_id,
-            app_name,
-            dev_eui,
-            device_name,
-            ts,
-            fcnt,
-            fport,
-            data_hex,
-            data_text,
-            data_json,
-            rssi_dbm,
-            snr_db,
-            dr,
-            freq_hz,
-            raw
-        FROM iot.uplinks
-        WHERE UPPER(dev_eui) = %s
-        {where_clause}
-        ORDER BY ts DESC NULLS LAST, inserted_at DESC
-        LIMIT %s OFFSET %s
-    """
+    sql = build_uplinks_sql(select_list, where_clause)
     params.extend([limit, offset])
 
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(sql, params)
-        rows = cur.fetchall()
-
-    return jsonify(rows)
+    return render_rows(conn, sql, params, fmt, columns + [n for n, _ in json_fields])
 
 
 @bp.route("/api/uplinks/<dev_eui>/latest/full", methods=["GET"])
@@ -322,31 +425,13 @@ def latest_uplink_full(dev_eui):
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
 
-    conn = get_db()
-    sql = """
-        SELECT
-            uplink_id,
-            inserted_at,
-            app_id,
-            app_name,
-            dev_eui,
-            device_name,
-            ts,
-            fcnt,
-            fport,
-            data_hex,
-            data_text,
-            data_json,
-            rssi_dbm,
-            snr_db,
-            dr,
-            freq_hz,
-            raw
-        FROM iot.uplinks
-        WHERE UPPER(dev_eui) = %s
-        ORDER BY ts DESC NULLS LAST, inserted_at DESC
-        LIMIT 1
-    """
+    try:
+        select_list = ", ".join(parse_fields(FULL_COLUMNS))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db(readonly=True, max_lag=parse_max_lag(current_app.config["DB_LATEST_MAX_LAG_S"]))
+    sql = build_uplinks_sql(select_list, limit_clause="LIMIT 1")
 
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
         cur.execute(sql, (dev_eui,))
@@ -358,6 +443,70 @@ def latest_uplink_full(dev_eui):
     return jsonify(row)
 
 
+# -----------------------
+# LINK QUALITY STATS
+# -----------------------
+
+LINK_STATS_SQL = """
+    SELECT
+        dev_eui,
+        app_name,
+        last_fcnt,
+        last_ts,
+        frames_received,
+        frames_expected,
+        fcnt_resets,
+        windows,
+        updated_at
+    FROM iot.device_link_stats
+"""
+
+
+@bp.route("/api/uplinks/<dev_eui>/stats", methods=["GET"])
+@require_api_key
+def device_link_stats(dev_eui):
+    """
+    Statistik link (packet loss dari gap fCnt, RSSI/SNR/DR) untuk satu device.
+    Dihitung inkremental oleh ingestor, tidak scan iot.uplinks.
+    Query ?hours=N (default 24) untuk window distribusi.
+    """
+    try:
+        dev_eui = normalize_dev_eui(dev_eui)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    hours = parse_window_hours()
+
+    conn = get_db(readonly=True, max_lag=parse_max_lag())
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(LINK_STATS_SQL + " WHERE dev_eui = %s", (dev_eui,))
+        row = cur.fetchone()
+
+    if not row:
+        return jsonify({"error": "No link stats found for this dev_eui"}), 404
+
+    return jsonify(summarize_link_stats(row, hours))
+
+
+@bp.route("/api/applications/<app_name>/stats", methods=["GET"])
+@require_api_key
+def application_link_stats(app_name):
+    """Statistik link semua device dalam satu aplikasi (urut loss_ratio window terburuk)."""
+    hours = parse_window_hours()
+
+    conn = get_db(readonly=True, max_lag=parse_max_lag())
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(LINK_STATS_SQL + " WHERE app_name = %s ORDER BY dev_eui", (app_name,))
+        rows = cur.fetchall()
+
+    if not rows:
+        return jsonify({"error": "No link stats found for this application"}), 404
+
+    result = [summarize_link_stats(row, hours) for row in rows]
+    result.sort(key=lambda r: r["window"]["loss_ratio"] or 0, reverse=True)
+    return jsonify(result)
+
+
 # -----------------------
 # DOWNLINK VIA MQTT
 # -----------------------
@@ -413,6 +562,11 @@ def api_downlink():
 
     topic = f"application/{appname}/device/{deveui}/tx"
 
+    try:
+        mqtt_client = get_mqtt_client()
+    except Exception as e:
+        return jsonify({"error": f"MQTT broker tidak tersedia: {e}"}), 503
+
     info = mqtt_client.publish(topic, json.dumps(payload), qos=1, retain=False)
     info.wait_for_publish()
 
@@ -1,17 +1,11 @@
+# flask_api/wsgi.py
+# Entry point gunicorn: gunicorn flask_api.wsgi:app
+# Import modul ini tidak membuka koneksi DB/MQTT; keduanya dibuat lazy per worker.
+from flask_api import create_app
 
-import os
-
-try:
-    # Jika app.py punya factory function: create_app()
-    from flask_api.app import create_app
-
-    app = create_app()
-except ImportError:
-    # Jika tidak ada create_app, ambil langsung objek app
-    from flask_api.app import app  # type: ignore
+app = create_app()
 
 
 if __name__ == "__main__":
     # Untuk testing langsung: python -m flask_api.wsgi
-    port = int(os.environ.get("FLASK_PORT"))
-    app.run(host="0.0.0.0", port=port)
+    app.run(host="0.0.0.0", port=app.config["FLASK_PORT"])
@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 import os
 import json
+import time
 import base64
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
 
 import psycopg2
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_values
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
 
@@ -17,14 +19,23 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
-DB_PORT = int(os.getenv("DB_PORT"))
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
 
 MQTT_HOST = os.getenv("MQTT_HOST")
-MQTT_PORT = int(os.getenv("MQTT_PORT"))
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
 MQTT_USERNAME = os.getenv("MQTT_USERNAME")
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
 MQTT_TOPIC = os.getenv("MQTT_TOPIC")
 
+# Dedup uplink multi-gateway sebelum ke DB (DEDUP_WINDOW_MS=0 -> nonaktif)
+DEDUP_WINDOW_MS = int(os.getenv("DEDUP_WINDOW_MS", "200"))
+DEDUP_MAX_PENDING = int(os.getenv("DEDUP_MAX_PENDING", "10000"))
+DEDUP_RECENT_KEYS = int(os.getenv("DEDUP_RECENT_KEYS", "50000"))
+
+# Statistik link per device (iot.device_link_stats)
+STATS_WINDOW_HOURS = int(os.getenv("STATS_WINDOW_HOURS", "24"))
+STATS_FLUSH_S = float(os.getenv("STATS_FLUSH_S", "10"))
+
 
 def connect_db():
     return psycopg2.connect(
@@ -36,8 +47,9 @@ def connect_db():
     )
 
 
-conn = connect_db()
-conn.autocommit = False
+# Koneksi dibuka saat uplink pertama (ensure_conn), supaya modul ini bisa
+# di-import tool lain (backfill, re-decode) tanpa efek samping.
+conn = None
 
 
 def ensure_conn():
@@ -153,6 +165,366 @@ def extract_timestamp(payload: dict):
     return None
 
 
+def _gateway_key(rx: dict):
+    return rx.get("gatewayID") or rx.get("gatewayId") or rx.get("mac")
+
+
+def merge_rx_infos(base: list, extra: list) -> list:
+    """
+    Gabungkan rxInfo dari beberapa salinan uplink yang sama.
+    Satu entri per gateway; jika gateway sama muncul lagi, simpan RSSI terbaik.
+    Urutan kedatangan dipertahankan (rxInfo[0] tetap dipakai extract_timestamp).
+    """
+    merged = []
+    index_by_gw = {}
+    for rx in list(base) + list(extra):
+        if not isinstance(rx, dict):
+            continue
+        gw = _gateway_key(rx)
+        if gw is None:
+            merged.append(rx)
+            continue
+        if gw not in index_by_gw:
+            index_by_gw[gw] = len(merged)
+            merged.append(rx)
+            continue
+        current = merged[index_by_gw[gw]]
+        if (rx.get("rssi") is not None
+                and (current.get("rssi") is None or rx["rssi"] > current["rssi"])):
+            merged[index_by_gw[gw]] = rx
+    return merged
+
+
+def best_signal(rx_infos):
+    """
+    Mengembalikan (rssi_dbm, snr_db, gw_count) dari satu gateway terbaik:
+    SNR tertinggi, kalau sama dipilih RSSI tertinggi. RSSI dan SNR selalu
+    berasal dari gateway yang sama; gw_count = jumlah gateway yang menerima.
+    """
+    if not rx_infos or not isinstance(rx_infos, list):
+        return None, None, None
+
+    rx_infos = [rx for rx in rx_infos if isinstance(rx, dict)]
+    measured = [rx for rx in rx_infos if rx.get("rssi") is not None or rx.get("loRaSNR") is not None]
+    if not measured:
+        return None, None, len(rx_infos) or None
+
+    def rank(rx):
+        snr, rssi = rx.get("loRaSNR"), rx.get("rssi")
+        return (
+            snr if snr is not None else float("-inf"),
+            rssi if rssi is not None else float("-inf"),
+        )
+
+    best = max(measured, key=rank)
+    return best.get("rssi"), best.get("loRaSNR"), len(rx_infos)
+
+
+class UplinkDeduper:
+    """
+    Menahan uplink selama window singkat supaya salinan dari gateway lain
+    (devEUI, fCnt, payload sama) digabung dulu, lalu disimpan sekali.
+
+    Memori dibatasi oleh max_pending (entri tertua langsung di-flush jika
+    penuh) dan recent_keys (key yang sudah disimpan, untuk membuang salinan
+    yang datang terlambat tanpa round trip ke DB).
+    """
+
+    def __init__(self, window_s: float, max_pending: int, recent_keys: int):
+        self.window_s = window_s
+        self.max_pending = max_pending
+        self.recent_keys = recent_keys
+        self._pending = OrderedDict()  # key -> [deadline, topic, payload]
+        self._recent = OrderedDict()   # key -> None
+        self.merged = 0
+        self.dropped_late = 0
+
+    @staticmethod
+    def key_for(payload: dict):
+        dev_eui = str(payload.get("devEUI") or "").strip().lower()
+        return dev_eui, payload.get("fCnt"), payload.get("data") or ""
+
+    def add(self, topic: str, payload: dict, now: float, store):
+        key = self.key_for(payload)
+
+        entry = self._pending.get(key)
+        if entry is not None:
+            entry[2]["rxInfo"] = merge_rx_infos(
+                entry[2].get("rxInfo") or [], payload.get("rxInfo") or []
+            )
+            self.merged += 1
+            return
+
+        if key in self._recent:
+            self.dropped_late += 1
+            return
+
+        self._pending[key] = [now + self.window_s, topic, payload]
+        while len(self._pending) > self.max_pending:
+            old_key, (_, old_topic, old_payload) = self._pending.popitem(last=False)
+            self._emit(old_key, old_topic, old_payload, store)
+
+    def flush_expired(self, now: float, store):
+        # Window konstan -> urutan insert == urutan deadline
+        while self._pending:
+            key, entry = next(iter(self._pending.items()))
+            if entry[0] > now:
+                break
+            del self._pending[key]
+            self._emit(key, entry[1], entry[2], store)
+
+    def flush_all(self, store):
+        while self._pending:
+            key, (_, topic, payload) = self._pending.popitem(last=False)
+            self._emit(key, topic, payload, store)
+
+    def _emit(self, key, topic, payload, store):
+        self._recent[key] = None
+        while len(self._recent) > self.recent_keys:
+            self._recent.popitem(last=False)
+        store(topic, payload)
+
+
+UPLINK_COLUMNS = (
+    "app_id",
+    "app_name",
+    "dev_eui",
+    "device_name",
+    "ts",
+    "fcnt",
+    "fport",
+    "data_hex",
+    "data_text",
+    "data_json",
+    "rssi_dbm",
+    "snr_db",
+    "dr",
+    "freq_hz",
+    "gw_count",
+    "raw",
+)
+
+
+INSERT_UPLINK_SQL = f"""
+    INSERT INTO iot.uplinks ({', '.join(UPLINK_COLUMNS)})
+    VALUES ({', '.join(['%s'] * len(UPLINK_COLUMNS))})
+    ON CONFLICT (dev_eui, fcnt, data_hex) DO NOTHING;
+"""
+
+
+def parse_uplink(payload: dict) -> dict:
+    """
+    Ubah payload uplink menjadi nilai kolom iot.uplinks (key = UPLINK_COLUMNS).
+    Dipakai store_uplink dan tool backfill supaya hasil decode identik.
+    Melempar ValueError jika devEUI tidak valid.
+    """
+    app_id = payload.get("applicationID")
+    data_hex, data_text, data_json = decode_data_fields(
+        payload.get("data") or "", payload.get("data_encode")
+    )
+    rssi_dbm, snr_db, gw_count = best_signal(payload.get("rxInfo") or [])
+    tx_info = payload.get("txInfo") or {}
+
+    return {
+        "app_id": app_id,
+        "app_name": payload.get("applicationName") or (f"app_{app_id}" if app_id else "unknown_app"),
+        "dev_eui": normalize_dev_eui(payload.get("devEUI", "")),
+        "device_name": payload.get("deviceName"),
+        "ts": extract_timestamp(payload),
+        "fcnt": payload.get("fCnt"),
+        "fport": payload.get("fPort"),
+        "data_hex": data_hex,
+        "data_text": data_text,
+        "data_json": data_json,
+        "rssi_dbm": rssi_dbm,
+        "snr_db": snr_db,
+        "dr": tx_info.get("dr"),
+        "freq_hz": tx_info.get("frequency"),
+        "gw_count": gw_count,
+        "raw": payload,
+    }
+
+
+class LinkStatsTracker:
+    """
+    Statistik link per device yang di-update setiap uplink baru tersimpan:
+      - frame expected vs received dari gap fCnt (termasuk reset counter)
+      - distribusi RSSI/SNR/DR per bucket 1 jam, hanya window_hours terakhir
+
+    State disimpan di memori dan di-flush (upsert) ke iot.device_link_stats
+    setiap flush_interval_s, sehingga API tidak perlu scan iot.uplinks.
+    State device dimuat dari tabel saat pertama terlihat, jadi restart
+    ingestor tidak mereset counter. Asumsi: hanya satu ingestor yang menulis.
+    """
+
+    BUCKET_S = 3600
+    RSSI_BIN = 10
+    SNR_BIN = 2
+    # fCnt mundur ke frame yang sudah dihitung hilang (maks. sejauh ini dari
+    # last_fcnt) = paket terlambat/out-of-order; mundur lainnya = reset counter
+    OUT_OF_ORDER_MAX = 16
+
+    def __init__(self, window_hours: int, flush_interval_s: float):
+        self.window_hours = window_hours
+        self.flush_interval_s = flush_interval_s
+        self._devices = {}
+        self._dirty = set()
+        self._last_flush = time.monotonic()
+
+    def _load(self, db_conn, dev_eui: str) -> dict:
+        with db_conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT app_name, last_fcnt, last_ts, frames_received,
+                       frames_expected, fcnt_resets, windows
+                FROM iot.device_link_stats
+                WHERE dev_eui = %s
+                """,
+                (dev_eui,),
+            )
+            found = cur.fetchone()
+        db_conn.commit()
+
+        if found is None:
+            return {
+                "app_name": None, "last_fcnt": None, "last_ts": None,
+                "received": 0, "expected": 0, "resets": 0, "windows": [],
+                "lost": set(),
+            }
+        return {
+            "app_name": found[0], "last_fcnt": found[1], "last_ts": found[2],
+            "received": found[3], "expected": found[4], "resets": found[5],
+            "windows": found[6] or [],
+            # fCnt yang dihitung hilang (hanya di memori, maks. OUT_OF_ORDER_MAX terakhir)
+            "lost": set(),
+        }
+
+    def _bucket(self, state: dict, ts: datetime) -> dict:
+        start = int(ts.timestamp()) // self.BUCKET_S * self.BUCKET_S
+        windows = state["windows"]
+        for bucket in reversed(windows):
+            if bucket["t"] == start:
+                return bucket
+        bucket = {"t": start, "rx": 0, "exp": 0, "rssi": None, "snr": None,
+                  "rssi_h": {}, "snr_h": {}, "dr": {}}
+        windows.append(bucket)
+        windows.sort(key=lambda b: b["t"])
+        return bucket
+
+    @staticmethod
+    def _add_metric(bucket: dict, name: str, value, bin_size: int):
+        if value is None:
+            return
+        agg = bucket[name]
+        bucket[name] = (
+            [value, value, value] if agg is None
+            else [agg[0] + value, min(agg[1], value), max(agg[2], value)]
+        )
+        key = str(int(value // bin_size * bin_size))
+        bucket[name + "_h"][key] = bucket[name + "_h"].get(key, 0) + 1
+
+    def observe(self, db_conn, row: dict):
+        dev_eui = row["dev_eui"].upper()
+        state = self._devices.get(dev_eui)
+        if state is None:
+            state = self._devices[dev_eui] = self._load(db_conn, dev_eui)
+
+        fcnt = row["fcnt"]
+        last = state["last_fcnt"]
+        lost = state["lost"]
+        expected = 1
+        if fcnt is not None and last is not None:
+            gap = fcnt - last
+            # gap == 0 atau mundur sedikit ke fCnt yang sudah diterima: store_uplink
+            # hanya memanggil observe untuk baris yang benar-benar baru, jadi fCnt
+            # sama dengan payload beda tetap dihitung satu frame
+            if gap > 0:
+                expected = gap
+                lost.update(range(max(last + 1, fcnt - self.OUT_OF_ORDER_MAX), fcnt))
+                lost.difference_update([f for f in lost if f < fcnt - self.OUT_OF_ORDER_MAX])
+                state["last_fcnt"] = fcnt
+            elif fcnt == 0 or (gap < 0 and (fcnt < self.OUT_OF_ORDER_MAX or -gap > self.OUT_OF_ORDER_MAX)):
+                # fCnt 0, kembali ke fCnt kecil (rejoin) atau mundur jauh: counter di-reset
+                state["resets"] += 1
+                expected = fcnt + 1
+                lost.clear()
+                state["last_fcnt"] = fcnt
+            elif fcnt in lost:
+                # Paket terlambat: sudah dihitung sebagai hilang waktu gap sebelumnya
+                lost.discard(fcnt)
+                expected = 0
+        elif fcnt is not None:
+            state["last_fcnt"] = fcnt
+
+        ts = row["ts"] if isinstance(row["ts"], datetime) else datetime.now(timezone.utc)
+        state["app_name"] = row["app_name"]
+        if state["last_ts"] is None or ts > state["last_ts"]:
+            state["last_ts"] = ts
+        state["received"] += 1
+        state["expected"] += expected
+
+        bucket = self._bucket(state, ts)
+        bucket["rx"] += 1
+        bucket["exp"] += expected
+        self._add_metric(bucket, "rssi", row["rssi_dbm"], self.RSSI_BIN)
+        self._add_metric(bucket, "snr", row["snr_db"], self.SNR_BIN)
+        if row["dr"] is not None:
+            bucket["dr"][str(row["dr"])] = bucket["dr"].get(str(row["dr"]), 0) + 1
+
+        self._dirty.add(dev_eui)
+
+    def maybe_flush(self, db_conn):
+        if time.monotonic() - self._last_flush >= self.flush_interval_s:
+            self.flush(db_conn)
+
+    def flush(self, db_conn):
+        self._last_flush = time.monotonic()
+        if not self._dirty:
+            return
+
+        oldest = int(time.time()) // self.BUCKET_S * self.BUCKET_S - (self.window_hours - 1) * self.BUCKET_S
+        values = []
+        for dev_eui in self._dirty:
+            state = self._devices[dev_eui]
+            state["windows"] = [b for b in state["windows"] if b["t"] >= oldest]
+            values.append((
+                dev_eui, state["app_name"], state["last_fcnt"], state["last_ts"],
+                state["received"], state["expected"], state["resets"],
+                Json(state["windows"]),
+            ))
+
+        try:
+            with db_conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO iot.device_link_stats (
+                      dev_eui, app_name, last_fcnt, last_ts, frames_received,
+                      frames_expected, fcnt_resets, windows
+                    )
+                    VALUES %s
+                    ON CONFLICT (dev_eui) DO UPDATE
+                    SET
+                      app_name = EXCLUDED.app_name,
+                      last_fcnt = EXCLUDED.last_fcnt,
+                      last_ts = EXCLUDED.last_ts,
+                      frames_received = EXCLUDED.frames_received,
+                      frames_expected = EXCLUDED.frames_expected,
+                      fcnt_resets = EXCLUDED.fcnt_resets,
+                      windows = EXCLUDED.windows,
+                      updated_at = now();
+                    """,
+                    values,
+                    page_size=len(values),
+                )
+            db_conn.commit()
+            print(f"[STATS] Flushed link stats for {len(values)} device(s)")
+            self._dirty.clear()
+        except Exception as e:
+            db_conn.rollback()
+            print(f"[ERROR] link stats flush failed: {e}")
+
+
 def store_uplink(msg_topic: str, payload: dict):
     """
     payload mengikuti format built-in NS WisGate/ChirpStack, contoh:
@@ -174,32 +546,13 @@ def store_uplink(msg_topic: str, payload: dict):
     cur = conn.cursor()
 
     try:
-        app_id = payload.get("applicationID")
-        app_name = payload.get("applicationName") or (f"app_{app_id}" if app_id else "unknown_app")
-        dev_eui = normalize_dev_eui(payload.get("devEUI", ""))
-        device_name = payload.get("deviceName")
-
-        fcnt = payload.get("fCnt")
-        fport = payload.get("fPort")
-
-        data_value = payload.get("data") or ""
-        encode_type = payload.get("data_encode")
-        data_hex, data_text, data_json = decode_data_fields(data_value, encode_type)
-
-        ts_value = extract_timestamp(payload)
-
-        rx_infos = payload.get("rxInfo") or []
-        rssi_dbm = None
-        snr_db = None
-        if rx_infos and isinstance(rx_infos, list):
-            rssi_dbm = rx_infos[0].get("rssi")
-            snr_db = rx_infos[0].get("loRaSNR")
-
-        tx_info = payload.get("txInfo") or {}
-        dr = tx_info.get("dr")
-        freq_hz = tx_info.get("frequency")
-
-        raw_json = payload
+        row = parse_uplink(payload)
+        app_name = row["app_name"]
+        dev_eui = row["dev_eui"]
+        fcnt = row["fcnt"]
+        gw_count = row["gw_count"]
+        data_hex, data_text, data_json = row["data_hex"], row["data_text"], row["data_json"]
+        ts_value = row["ts"]
 
         # 1) Ensure application
         cur.execute(
@@ -222,109 +575,54 @@ def store_uplink(msg_topic: str, payload: dict):
               device_name = COALESCE(EXCLUDED.device_name, iot.devices.device_name),
               last_seen = COALESCE(EXCLUDED.last_seen, iot.devices.last_seen);
             """,
-            (dev_eui, app_name, device_name, ts_value, ts_value),
+            (dev_eui, app_name, row["device_name"], ts_value, ts_value),
         )
 
         # 3) Insert uplink
         cur.execute(
-            """
-            INSERT INTO iot.uplinks (
-              app_id,
-              app_name,
-              dev_eui,
-              device_name,
-              ts,
-              fcnt,
-              fport,
-              data_hex,
-              data_text,
-              data_json,
-              rssi_dbm,
-              snr_db,
-              dr,
-              freq_hz,
-              raw
-            )
-            VALUES (
-              %s, %s, %s, %s, %s,
-              %s, %s,
-              %s, %s, %s,
-              %s, %s,
-              %s, %s,
-              %s
-            )
-            ON CONFLICT (dev_eui, fcnt, data_hex) DO NOTHING;
-            """,
-            (
-                app_id,
-                app_name,
-                dev_eui,
-                device_name,
-                ts_value,
-                fcnt,
-                fport,
-                data_hex,
-                data_text,
-                Json(data_json) if data_json is not None else None,
-                rssi_dbm,
-                snr_db,
-                dr,
-                freq_hz,
-                Json(raw_json),
+            INSERT_UPLINK_SQL,
+            tuple(
+                Json(row[col]) if col in ("data_json", "raw") and row[col] is not None else row[col]
+                for col in UPLINK_COLUMNS
             ),
         )
+        inserted = cur.rowcount == 1
 
         conn.commit()
-        print(f"[DB] Stored uplink devEUI={dev_eui}, fCnt={fcnt}, topic={msg_topic}")
-        print(f"       encode={encode_type}, data_hex={data_hex}")
+        print(f"[DB] Stored uplink devEUI={dev_eui}, fCnt={fcnt}, gateways={gw_count}, topic={msg_topic}")
+        print(f"       encode={payload.get('data_encode')}, data_hex={data_hex}")
         print(f"       data_text={data_text!r}, data_json_type={type(data_json).__name__ if data_json is not None else 'None'}")
 
     except Exception as e:
         conn.rollback()
         print(f"[ERROR] store_uplink failed: {e}")
+        return
     finally:
         cur.close()
 
+    # Duplikat yang dibuang ON CONFLICT tidak ikut dihitung
+    if inserted:
+        try:
+            link_stats.observe(conn, row)
+        except Exception as e:
+            conn.rollback()
+            print(f"[ERROR] link stats update failed: {e}")
+    link_stats.maybe_flush(conn)
 
-def on_connect(client, userdata, flags, rc):
-    if rc == 0:
-        print(f"[MQTT] Connected to {MQTT_HOST}:{MQTT_PORT}")
-        client.subscribe(MQTT_TOPIC)
-        print(f"[MQTT] Subscribed to: {MQTT_TOPIC}")
-    else:
-        print(f"[MQTT] Failed to connect, rc={rc}")
-
-
-def on_message(client, userdata, msg):
-    try:
-        payload_str = msg.payload.decode("utf-8")
-        data = json.loads(payload_str)
-    except Exception as e:
-        print(f"[MQTT] Failed to parse message on {msg.topic}: {e}")
-        return
-
-    print(f"[MQTT] RX topic={msg.topic}")
-    store_uplink(msg.topic, data)
-
-
-def main():
-    client = mqtt.Client()
-
-    if MQTT_USERNAME:
-        client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
-
-    client.on_connect = on_connect
-    client.on_message = on_message
-
-    print(f"[MQTT] Connecting to {MQTT_HOST}:{MQTT_PORT} ...")
-    client.connect(MQTT_HOST, MQTT_PORT, keepalive=60)
 
-    client.loop_forever()
+link_stats = LinkStatsTracker(STATS_WINDOW_HOURS, STATS_FLUSH_S)
 
 
 # ----------------------------
 # MQTT callbacks
 # ----------------------------
+deduper = (
+    UplinkDeduper(DEDUP_WINDOW_MS / 1000.0, DEDUP_MAX_PENDING, DEDUP_RECENT_KEYS)
+    if DEDUP_WINDOW_MS > 0
+    else None
+)
+
+
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         print(f"[MQTT] Connected to {MQTT_HOST}:{MQTT_PORT}")
@@ -343,7 +641,10 @@ def on_message(client, userdata, msg):
         return
 
     print(f"[MQTT] RX topic={msg.topic}")
-    store_uplink(msg.topic, data)
+    if deduper is None:
+        store_uplink(msg.topic, data)
+    else:
+        deduper.add(msg.topic, data, time.monotonic(), store_uplink)
 
 
 def main():
@@ -358,7 +659,37 @@ def main():
     print(f"[MQTT] Connecting to {MQTT_HOST}:{MQTT_PORT} ...")
     client.connect(MQTT_HOST, MQTT_PORT, keepalive=60)
 
-    client.loop_forever()
+    if deduper is None:
+        try:
+            client.loop_forever()
+        finally:
+            if conn is not None:
+                link_stats.flush(conn)
+        return
+
+    # Loop manual agar window dedup tetap di-flush walau tidak ada traffic.
+    # Callback dan store_uplink berjalan di thread yang sama, jadi tanpa lock.
+    tick = min(0.05, deduper.window_s / 2)
+    try:
+        while True:
+            rc = client.loop(timeout=tick)
+            if rc != mqtt.MQTT_ERR_SUCCESS:
+                print(f"[MQTT] Connection lost (rc={rc}), reconnecting ...")
+                deduper.flush_all(store_uplink)
+                time.sleep(1)
+                try:
+                    client.reconnect()
+                except Exception as e:
+                    print(f"[MQTT] Reconnect failed: {e}")
+                continue
+            deduper.flush_expired(time.monotonic(), store_uplink)
+            if conn is not None:
+                link_stats.maybe_flush(conn)
+    finally:
+        deduper.flush_all(store_uplink)
+        if conn is not None:
+            link_stats.flush(conn)
+        print(f"[DEDUP] merged={deduper.merged}, dropped_late={deduper.dropped_late}")
 
 
 if __name__ == "__main__":
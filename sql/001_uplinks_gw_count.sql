@@ -0,0 +1,3 @@
+-- sql/001_uplinks_gw_count.sql
+-- Jumlah gateway yang menerima uplink (hasil merge dedup multi-gateway di ingestor).
+ALTER TABLE iot.uplinks ADD COLUMN IF NOT EXISTS gw_count smallint;
@@ -0,0 +1,20 @@
+-- sql/002_device_link_stats.sql
+-- Statistik link per device, di-update inkremental oleh ingestor (LinkStatsTracker).
+-- windows: bucket 1 jam terakhir, contoh elemen:
+--   {"t": 1763640000, "rx": 58, "exp": 60,
+--    "rssi": [sum, min, max], "snr": [sum, min, max],
+--    "rssi_h": {"-100": 40, "-90": 18}, "snr_h": {"2": 30, "4": 28}, "dr": {"2": 58}}
+CREATE TABLE IF NOT EXISTS iot.device_link_stats (
+  dev_eui          text PRIMARY KEY,  -- uppercase
+  app_name         text,
+  last_fcnt        bigint,
+  last_ts          timestamptz,
+  frames_received  bigint NOT NULL DEFAULT 0,
+  frames_expected  bigint NOT NULL DEFAULT 0,
+  fcnt_resets      integer NOT NULL DEFAULT 0,
+  windows          jsonb NOT NULL DEFAULT '[]'::jsonb,
+  updated_at       timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS device_link_stats_app_name_idx
+  ON iot.device_link_stats (app_name);
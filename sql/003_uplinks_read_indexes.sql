@@ -0,0 +1,8 @@
+-- sql/003_uplinks_read_indexes.sql
+-- Index untuk semua route uplink per device (build_uplinks_sql di flask_api/routes.py):
+-- WHERE UPPER(dev_eui) = ? [AND ts range] ORDER BY ts DESC NULLS LAST, inserted_at DESC LIMIT n
+-- Urutan index sama dengan ORDER BY, jadi tanpa Sort dan berhenti setelah n baris.
+-- CONCURRENTLY: jalankan di luar transaksi (psql -f biasa sudah autocommit).
+-- Diverifikasi oleh: python -m tools.plan_check
+CREATE INDEX CONCURRENTLY IF NOT EXISTS uplinks_dev_eui_ts_idx
+  ON iot.uplinks (UPPER(dev_eui), ts DESC NULLS LAST, inserted_at DESC);
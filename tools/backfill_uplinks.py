@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# tools/backfill_uplinks.py
+"""
+Backfill / replay uplink ChirpStack dari file arsip ke iot.uplinks.
+
+Format input (per baris, boleh .gz):
+  - JSONL: satu payload uplink JSON per baris
+  - log broker (mosquitto_sub -v): "<topic> <payload JSON>"
+
+File biasa dipecah per potongan byte; file .gz (tidak bisa di-seek) dibaca
+streaming di proses utama dan dikirim per --gz-lines baris. Potongan di-parse
+paralel di process pool memakai parse_uplink() dari ingestor
+(decode_data_fields, extract_timestamp, normalize_dev_eui), lalu ditulis lewat
+COPY ke tabel staging dan di-merge dengan ON CONFLICT (dev_eui, fcnt, data_hex)
+DO NOTHING, sama seperti ingestor.
+
+Salinan multi-gateway digabung dengan merge_rx_infos: di dalam satu potongan
+oleh worker, dan antar potongan yang bersebelahan oleh proses utama (potongan
+terakhir selalu ditahan ke batch berikutnya, jadi salinan di batas potongan
+tetap bertemu sebelum ditulis).
+
+Progress (offset byte, atau nomor baris untuk .gz) disimpan ke file checkpoint
+setelah tiap commit, jadi proses bisa dihentikan dan dijalankan ulang tanpa
+memuat ulang data yang sudah masuk.
+
+Contoh:
+  python -m tools.backfill_uplinks dump-2024-*.jsonl.gz --workers 8
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+from collections import deque
+from datetime import datetime
+
+from .common import connect_db, copy_rows, load_ingestor
+
+_ingestor = None
+
+
+def _get_ingestor():
+    global _ingestor
+    if _ingestor is None:
+        _ingestor = load_ingestor()
+    return _ingestor
+
+
+# -----------------------
+# CHUNKING & CHECKPOINT
+# -----------------------
+
+def plan_chunks(path, chunk_bytes):
+    """Bagi file (bukan .gz) menjadi (start, end) yang selalu berakhir di batas baris."""
+    size = os.path.getsize(path)
+    chunks = []
+    start = 0
+    with open(path, "rb") as f:
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def iter_tasks(path, state, chunk_bytes, gz_lines):
+    """
+    Task untuk worker: (kind, path, mark, data).
+    mark = (key checkpoint, nilai, file selesai?) yang dicatat setelah task ditulis.
+      - file biasa : ("bytes", ..., ("offset", end, ...), (start, end))
+      - file .gz   : ("lines", ..., ("line", nomor baris terakhir, ...), [baris, ...])
+    """
+    if not path.endswith(".gz"):
+        size = os.path.getsize(path)
+        offset = state.get("offset", 0)
+        for start, end in plan_chunks(path, chunk_bytes):
+            if end > offset:
+                yield "bytes", path, ("offset", end, end >= size), (start, end)
+        return
+
+    skip = state.get("line", 0)
+    line_no = 0
+    batch = []
+    with gzip.open(path, "rt", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line_no += 1
+            if line_no <= skip:
+                continue
+            batch.append(line)
+            if len(batch) >= gz_lines:
+                yield "lines", path, ("line", line_no, False), batch
+                batch = []
+    # Task terakhir (boleh kosong) menandai file selesai
+    yield "lines", path, ("line", line_no, True), batch
+
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get("files", {})
+
+
+def save_checkpoint(path, files):
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"updated_at": datetime.now().isoformat(), "files": files}, f, indent=2)
+    os.replace(tmp, path)
+
+
+# -----------------------
+# PARSING (di worker)
+# -----------------------
+
+def parse_line(line: str):
+    line = line.strip()
+    if not line:
+        return None
+    if not line.startswith("{"):
+        # Format log broker: "<topic> <payload>"
+        _, _, line = line.partition(" ")
+        line = line.strip()
+        if not line.startswith("{"):
+            return None
+    payload = json.loads(line)
+    if not isinstance(payload, dict) or "devEUI" not in payload or "fCnt" not in payload:
+        return None
+    return payload
+
+
+def _csv_value(col, value):
+    if value is None:
+        return None
+    if col in ("data_json", "raw"):
+        return json.dumps(value, separators=(",", ":"))
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _row_tuple(ing, payload):
+    row = ing.parse_uplink(payload)
+    return tuple(_csv_value(col, row[col]) for col in ing.UPLINK_COLUMNS)
+
+
+def parse_chunk(task):
+    """Worker: parse satu task -> (path, mark, rows, lines, skipped)."""
+    kind, path, mark, data = task
+    ing = _get_ingestor()
+
+    if kind == "lines":
+        lines = data
+    else:
+        start, end = data
+        with open(path, "rb") as f:
+            f.seek(start)
+            lines = f.read(end - start).decode("utf-8", errors="replace").splitlines()
+
+    # Gabungkan salinan multi-gateway di potongan yang sama (seperti UplinkDeduper)
+    merged = {}
+    skipped = 0
+    for line in lines:
+        try:
+            payload = parse_line(line)
+        except ValueError:
+            payload = None
+        if payload is None:
+            skipped += 1
+            continue
+        key = ing.UplinkDeduper.key_for(payload)
+        if key in merged:
+            merged[key]["rxInfo"] = ing.merge_rx_infos(
+                merged[key].get("rxInfo") or [], payload.get("rxInfo") or []
+            )
+        else:
+            merged[key] = payload
+
+    rows = []
+    for payload in merged.values():
+        try:
+            rows.append(_row_tuple(ing, payload))
+        except ValueError:
+            skipped += 1
+
+    return path, mark, rows, len(lines), skipped
+
+
+class PendingRows:
+    """
+    Baris yang belum ditulis, per potongan, dengan index key konflik
+    (dev_eui, fcnt, data_hex). Salinan uplink yang sama dari potongan lain
+    digabung ke entri yang sudah ada (rxInfo di-merge, sinyal dihitung ulang).
+    """
+
+    def __init__(self, ing):
+        self.ing = ing
+        columns = ing.UPLINK_COLUMNS
+        self.key_idx = [columns.index(c) for c in ("dev_eui", "fcnt", "data_hex")]
+        self.raw_idx = columns.index("raw")
+        self.chunks = []  # [(path, mark, {key: row})]
+        self.index = {}   # key -> dict rows milik potongan yang memuatnya
+        self.n_rows = 0
+        self.merged = 0
+
+    def add(self, path, mark, rows):
+        own = {}
+        for row in rows:
+            key = tuple(row[i] for i in self.key_idx)
+            holder = self.index.get(key)
+            if holder is not None:
+                holder[key] = self._merge(holder[key], row)
+                self.merged += 1
+                continue
+            own[key] = row
+            self.index[key] = own
+        self.chunks.append((path, mark, own))
+        self.n_rows += len(own)
+
+    def _merge(self, row, other):
+        payload = json.loads(row[self.raw_idx])
+        extra = json.loads(other[self.raw_idx])
+        payload["rxInfo"] = self.ing.merge_rx_infos(payload.get("rxInfo") or [], extra.get("rxInfo") or [])
+        return _row_tuple(self.ing, payload)
+
+    def take(self, keep_last):
+        """Ambil (rows, marks) untuk ditulis; potongan terakhir ditahan jika keep_last."""
+        n = len(self.chunks) - 1 if keep_last else len(self.chunks)
+        taken, self.chunks = self.chunks[:n], self.chunks[n:]
+        rows, marks = [], []
+        for path, mark, own in taken:
+            for key in own:
+                del self.index[key]
+            rows.extend(own.values())
+            marks.append((path, mark))
+            self.n_rows -= len(own)
+        return rows, marks
+
+
+# -----------------------
+# WRITE (di proses utama)
+# -----------------------
+
+def create_stage(cur, columns):
+    cur.execute(
+        f"""
+        CREATE TEMP TABLE backfill_stage
+        ON COMMIT DELETE ROWS
+        AS SELECT {', '.join(columns)} FROM iot.uplinks WITH NO DATA
+        """
+    )
+
+
+def write_batch(conn, columns, rows):
+    """COPY ke staging lalu merge. Mengembalikan jumlah uplink baru."""
+    col_list = ", ".join(columns)
+    with conn.cursor() as cur:
+        copy_rows(cur, "backfill_stage", columns, rows)
+
+        cur.execute(
+            """
+            INSERT INTO iot.applications (app_name)
+            SELECT DISTINCT app_name FROM backfill_stage
+            ON CONFLICT (app_name) DO NOTHING
+            """
+        )
+        # Data historis: first_seen/last_seen hanya boleh melebar
+        cur.execute(
+            """
+            INSERT INTO iot.devices (dev_eui, app_name, device_name, first_seen, last_seen)
+            SELECT DISTINCT ON (dev_eui)
+                dev_eui,
+                app_name,
+                device_name,
+                COALESCE(MIN(ts) OVER w, now()),
+                COALESCE(MAX(ts) OVER w, now())
+            FROM backfill_stage
+            WINDOW w AS (PARTITION BY dev_eui)
+            ORDER BY dev_eui, ts DESC NULLS LAST
+            ON CONFLICT (dev_eui) DO UPDATE
+            SET
+              app_name = CASE WHEN EXCLUDED.last_seen >= iot.devices.last_seen
+                              THEN EXCLUDED.app_name ELSE iot.devices.app_name END,
+              device_name = COALESCE(iot.devices.device_name, EXCLUDED.device_name),
+              first_seen = LEAST(iot.devices.first_seen, EXCLUDED.first_seen),
+              last_seen = GREATEST(iot.devices.last_seen, EXCLUDED.last_seen)
+            """
+        )
+        cur.execute(
+            f"""
+            INSERT INTO iot.uplinks ({col_list})
+            SELECT {col_list} FROM backfill_stage
+            ON CONFLICT (dev_eui, fcnt, data_hex) DO NOTHING
+            """
+        )
+        inserted = cur.rowcount
+    conn.commit()
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill uplink dari file JSONL / log broker")
+    parser.add_argument("files", nargs="+", help="File input (.jsonl, .log, boleh .gz)")
+    parser.add_argument("--dsn", help="DSN PostgreSQL (default: DB_* dari .env)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Jumlah proses parser")
+    parser.add_argument("--chunk-mb", type=float, default=8.0, help="Ukuran potongan file per task (MB)")
+    parser.add_argument("--gz-lines", type=int, default=100000, help="Baris per task untuk file .gz")
+    parser.add_argument("--batch-rows", type=int, default=50000, help="Baris per COPY/commit")
+    parser.add_argument("--checkpoint", default=".backfill-checkpoint.json", help="File checkpoint ('' = nonaktif)")
+    parser.add_argument("--restart", action="store_true", help="Abaikan checkpoint lama")
+    args = parser.parse_args()
+
+    ing = _get_ingestor()
+    columns = ing.UPLINK_COLUMNS
+    chunk_bytes = max(1, int(args.chunk_mb * 1024 * 1024))
+
+    done = {} if args.restart else load_checkpoint(args.checkpoint)
+    paths = []
+    for path in args.files:
+        path = os.path.abspath(path)
+        if done.get(path, {}).get("done"):
+            print(f"[BACKFILL] skip {path} (selesai menurut checkpoint)")
+            continue
+        paths.append(path)
+
+    if not paths:
+        print("[BACKFILL] Tidak ada data baru.")
+        return
+
+    # Lazy: file .gz dibaca sambil jalan, jumlah task di memori dibatasi inflight
+    tasks = itertools.chain.from_iterable(
+        iter_tasks(path, done.get(path, {}), chunk_bytes, args.gz_lines) for path in paths
+    )
+
+    conn = connect_db(args.dsn)
+    conn.autocommit = False
+    with conn.cursor() as cur:
+        create_stage(cur, columns)
+    conn.commit()
+
+    print(f"[BACKFILL] {len(paths)} file, {args.workers} worker")
+    t0 = time.perf_counter()
+    total_lines = total_written = total_inserted = total_skipped = 0
+    pending = PendingRows(ing)
+
+    def flush(keep_last):
+        nonlocal total_inserted, total_written
+        rows, marks = pending.take(keep_last)
+        if not marks:
+            return
+        if rows:
+            total_inserted += write_batch(conn, columns, rows)
+            total_written += len(rows)
+        for path, (key, value, finished) in marks:
+            state = done.setdefault(path, {})
+            state[key] = value
+            if finished:
+                state["done"] = True
+        save_checkpoint(args.checkpoint, done)
+
+        elapsed = time.perf_counter() - t0
+        print(
+            f"[BACKFILL] {total_written:,} uplink ditulis, {total_inserted:,} baru, "
+            f"{total_written - total_inserted:,} duplikat, "
+            f"{pending.merged:,} salinan antar potongan digabung, {total_written / elapsed:,.0f} rows/s"
+        )
+
+    ctx = multiprocessing.get_context("fork" if sys.platform != "win32" else "spawn")
+    inflight = deque()
+    try:
+        with ctx.Pool(args.workers) as pool:
+            while True:
+                # Hasil diproses berurutan sesuai file, supaya potongan bersebelahan bertemu
+                while len(inflight) < args.workers * 2:
+                    task = next(tasks, None)
+                    if task is None:
+                        break
+                    inflight.append(pool.apply_async(parse_chunk, (task,)))
+                if not inflight:
+                    break
+
+                path, mark, rows, n_lines, skipped = inflight.popleft().get()
+                total_lines += n_lines
+                total_skipped += skipped
+                pending.add(path, mark, rows)
+                if pending.n_rows >= args.batch_rows:
+                    flush(keep_last=True)
+            flush(keep_last=False)
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - t0
+    print(
+        f"[BACKFILL] Selesai dalam {elapsed:.1f}s: {total_lines:,} baris dibaca, "
+        f"{total_skipped:,} dilewati, {total_inserted:,} uplink baru "
+        f"({total_written / elapsed if elapsed else 0:,.0f} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# tools/bench_compression.py
+"""
+Benchmark ukuran response (bytes-on-wire) dan biaya CPU kompresi untuk
+list endpoint uplink, dengan dan tanpa proyeksi ?fields=.
+
+Data dibuat sintetis dengan generator tools.seed_uplinks (tanpa DB), lalu
+diserialisasi seperti jsonify dan dikompres memakai encode_body() yang sama
+dengan after_request API.
+
+Contoh:
+  python -m tools.bench_compression --rows 500 --repeat 20
+"""
+import json
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+from flask_api.compression import brotli, encode_body
+from flask_api.routes import COMPACT_COLUMNS, FULL_COLUMNS
+
+from .seed_uplinks import UPLINK_COLUMNS, WIB_TZ, build_devices, generate_uplinks
+
+PROJECTIONS = {
+    "full": FULL_COLUMNS,
+    "compact": COMPACT_COLUMNS,
+    "ts,data_json": ("ts", "data_json"),
+}
+
+
+def make_rows(n):
+    args = argparse.Namespace(
+        devices=1, apps=1, gateways=1, interval=60.0, days=n / 1440.0 + 1,
+        loss=0.0, prefix="5eed", app_prefix="BenchApp", app_names=None,
+    )
+    start = datetime.now(WIB_TZ) - timedelta(days=args.days)
+    rows = []
+    for i, values in enumerate(generate_uplinks(args, build_devices(args), start, random.Random(1))):
+        if i >= n:
+            break
+        row = dict(zip(UPLINK_COLUMNS, values))
+        row["uplink_id"] = 1000000 + i
+        row["data_json"] = json.loads(row["data_json"])
+        row["raw"] = json.loads(row["raw"])
+        rows.append(row)
+    return rows
+
+
+def serialize(rows, columns):
+    # Mirip DefaultJSONProvider Flask: compact, sort_keys
+    projected = [{c: r.get(c) for c in columns} for r in rows]
+    return json.dumps(projected, separators=(",", ":"), sort_keys=True, default=str).encode("utf-8")
+
+
+def measure(data, encoding, level, repeat):
+    walls, cpus = [], []
+    for _ in range(repeat):
+        w0, c0 = time.perf_counter(), time.process_time()
+        body = encode_body(data, encoding, level)
+        walls.append(time.perf_counter() - w0)
+        cpus.append(time.process_time() - c0)
+    return len(body), statistics.median(walls) * 1000, statistics.median(cpus) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark kompresi response uplink")
+    parser.add_argument("--rows", type=int, default=500, help="Jumlah baris per response")
+    parser.add_argument("--repeat", type=int, default=20, help="Ulangan per kombinasi")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    encodings = [("gzip", 1), ("gzip", 6), ("gzip", 9)]
+    if brotli is not None:
+        encodings += [("br", 1), ("br", 4), ("br", 11)]
+    else:
+        print("[BENCH] modul brotli tidak terpasang, hanya gzip")
+
+    print(f"{'fields':<14} {'encoding':<10} {'bytes':>10} {'ratio':>7} {'wall ms':>9} {'cpu ms':>8}")
+    for name, columns in PROJECTIONS.items():
+        data = serialize(rows, columns)
+        print(f"{name:<14} {'identity':<10} {len(data):>10} {1.0:>7.2f} {0:>9.2f} {0:>8.2f}")
+        for encoding, level in encodings:
+            size, wall_ms, cpu_ms = measure(data, encoding, level, args.repeat)
+            print(
+                f"{name:<14} {f'{encoding}-{level}':<10} {size:>10} "
+                f"{len(data) / size:>7.2f} {wall_ms:>9.2f} {cpu_ms:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# tools/bench_startup.py
+"""
+Benchmark waktu import flask_api.wsgi (boot worker gunicorn).
+
+Setiap run memakai interpreter baru (python -X importtime) sehingga cache
+modul tidak ikut terhitung. Exit code 1 jika median melebihi --budget-ms,
+jadi bisa dipasang di CI sebagai startup budget.
+
+Contoh:
+  python -m tools.bench_startup --runs 10 --budget-ms 400
+"""
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+
+from .common import BASE_DIR
+
+
+def run_once(module):
+    cmd = [sys.executable, "-X", "importtime", "-c", f"import {module}"]
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=BASE_DIR, capture_output=True, text=True)
+    elapsed = time.perf_counter() - t0
+    if proc.returncode != 0:
+        tail = "\n".join(proc.stderr.strip().splitlines()[-5:])
+        raise SystemExit(f"[BENCH] import {module} gagal:\n{tail}")
+    return elapsed, parse_importtime(proc.stderr)
+
+
+def parse_importtime(stderr):
+    """Ambil {modul top-level: cumulative_us} dari output -X importtime."""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            cum_us = int(parts[1].strip())
+        except ValueError:
+            continue
+        name = parts[2].rstrip()
+        # Indentasi = kedalaman import; hanya ambil modul level teratas
+        if name.startswith("  "):
+            continue
+        cumulative[name.strip()] = cum_us
+    return cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import time flask_api.wsgi")
+    parser.add_argument("--module", default="flask_api.wsgi", help="Modul yang di-import")
+    parser.add_argument("--runs", type=int, default=7, help="Jumlah interpreter baru")
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="Batas median (ms)")
+    parser.add_argument("--top", type=int, default=10, help="Tampilkan N modul paling mahal")
+    args = parser.parse_args()
+
+    walls = []
+    per_module = defaultdict(list)
+    for _ in range(args.runs):
+        wall, modules = run_once(args.module)
+        walls.append(wall * 1000)
+        for name, us in modules.items():
+            per_module[name].append(us / 1000)
+
+    median = statistics.median(walls)
+    print(f"[BENCH] import {args.module}: median {median:.1f} ms, "
+          f"min {min(walls):.1f} ms, max {max(walls):.1f} ms ({args.runs} runs, termasuk start interpreter)")
+
+    ranked = sorted(per_module.items(), key=lambda kv: statistics.median(kv[1]), reverse=True)
+    print(f"\n{'module':<40} {'cumulative ms':>14}")
+    for name, values in ranked[:args.top]:
+        print(f"{name:<40} {statistics.median(values):>14.1f}")
+
+    if median > args.budget_ms:
+        print(f"\n[BENCH] GAGAL: median {median:.1f} ms > budget {args.budget_ms:.0f} ms")
+        sys.exit(1)
+    print(f"\n[BENCH] OK: median {median:.1f} ms <= budget {args.budget_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
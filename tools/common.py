@@ -0,0 +1,126 @@
+# tools/common.py
+import io
+import os
+import csv
+import sys
+import math
+import itertools
+import importlib.util
+from pathlib import Path
+
+import psycopg2
+from dotenv import load_dotenv
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Muat .env dari root project (sama seperti ingestor dan flask_api)
+load_dotenv(BASE_DIR / ".env")
+
+
+def connect_db(dsn: str | None = None):
+    """
+    Koneksi psycopg2 untuk tool CLI.
+    Jika dsn tidak diisi, pakai variabel DB_* dari .env.
+    """
+    if dsn:
+        return psycopg2.connect(dsn)
+
+    return psycopg2.connect(
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=int(os.getenv("DB_PORT", "5432")),
+    )
+
+
+def percentile(sorted_values, pct: float):
+    """Nearest-rank percentile dari list yang sudah terurut."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class _CsvStream(io.TextIOBase):
+    """File-like untuk copy_expert: menarik potongan CSV dari generator on demand."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buf = ""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) < size:
+            try:
+                self._buf += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            out, self._buf = self._buf, ""
+        else:
+            out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+
+class Counted:
+    """Iterator pembungkus yang menghitung jumlah item yang sudah lewat."""
+
+    def __init__(self, it):
+        self._it = iter(it)
+        self.n = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._it)
+        self.n += 1
+        return item
+
+
+COPY_NULL = r"\N"
+
+
+def csv_chunks(rows, rows_per_chunk=1000):
+    """
+    Ubah iterable tuple menjadi potongan string CSV.
+    None ditulis sebagai COPY_NULL supaya string kosong tetap string kosong (bukan NULL).
+    """
+    rows = iter(rows)
+    while True:
+        block = list(itertools.islice(rows, rows_per_chunk))
+        if not block:
+            return
+        out = io.StringIO()
+        writer = csv.writer(out)
+        for row in block:
+            writer.writerow([COPY_NULL if v is None else v for v in row])
+        yield out.getvalue()
+
+
+def copy_rows(cur, table, columns, rows):
+    """COPY rows (iterable tuple) ke table dalam format CSV."""
+    sql = (
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN "
+        f"WITH (FORMAT csv, NULL '{COPY_NULL}')"
+    )
+    cur.copy_expert(sql, _CsvStream(csv_chunks(rows)))
+
+
+def load_ingestor():
+    """
+    Import mqtt-to-postgres.py sebagai modul (nama file memakai '-').
+    Dipakai tool yang harus men-decode uplink persis sama dengan ingestor.
+    """
+    name = "mqtt_to_postgres"
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.spec_from_file_location(name, BASE_DIR / "mqtt-to-postgres.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
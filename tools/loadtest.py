@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# tools/loadtest.py
+"""
+Load driver untuk endpoint uplink API.
+
+Menjalankan campuran request (--mix) pada concurrency tertentu lalu
+melaporkan throughput dan latency p50/p95/p99 per route.
+
+Mode:
+  - in-process (default): memakai create_app() dari flask_api + test_client,
+    berguna untuk mengukur biaya query + serialisasi tanpa overhead HTTP.
+  - HTTP: --base-url http://host:port untuk menembak server gunicorn sungguhan.
+
+Contoh:
+  python -m tools.loadtest --concurrency 32 --duration 60 \\
+      --mix compact=50,latest=20,last10=20,devices=5,full=5
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+
+from .common import percentile
+
+ROUTES = {
+    "devices": "/api/uplinks/devices",
+    "compact": "/api/uplinks/{dev_eui}?limit={limit}",
+    "latest": "/api/uplinks/{dev_eui}/latest",
+    "last10": "/api/uplinks/{dev_eui}/last10?n={limit}",
+    "full": "/api/uplinks/{dev_eui}/full?limit={limit}",
+    "latest_full": "/api/uplinks/{dev_eui}/latest/full",
+}
+
+DEFAULT_MIX = "compact=50,latest=20,last10=20,devices=5,full=5"
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"Route tidak dikenal: {name} (pilihan: {', '.join(ROUTES)})")
+        mix[name] = float(weight or 1)
+    if not mix:
+        raise ValueError("--mix kosong")
+    return mix
+
+
+class InProcessClient:
+    """Client memakai Flask test_client (satu per thread)."""
+
+    def __init__(self, app, api_key):
+        self._client = app.test_client()
+        self._headers = {"X-API-Key": api_key}
+
+    def get(self, path):
+        resp = self._client.get(path, headers=self._headers)
+        body = resp.get_data()
+        return resp.status_code, body
+
+
+class HttpClient:
+    """Client HTTP memakai requests.Session (satu per thread)."""
+
+    def __init__(self, base_url, api_key, timeout):
+        import requests
+
+        self._session = requests.Session()
+        self._session.headers["X-API-Key"] = api_key
+        self._base_url = base_url.rstrip("/")
+        self._timeout = timeout
+
+    def get(self, path):
+        resp = self._session.get(self._base_url + path, timeout=self._timeout)
+        return resp.status_code, resp.content
+
+
+def discover_devices(client, sample, rng):
+    status, body = client.get(ROUTES["devices"])
+    if status != 200:
+        raise SystemExit(f"[LOAD] Gagal mengambil daftar device: HTTP {status} {body[:200]!r}")
+    devices = [row["dev_eui"] for row in json.loads(body)]
+    if not devices:
+        raise SystemExit("[LOAD] Tidak ada device di iot.uplinks. Jalankan tools.seed_uplinks dulu.")
+    if sample and len(devices) > sample:
+        devices = rng.sample(devices, sample)
+    return devices
+
+
+def worker(make_client, mix, devices, args, deadline, results, seed):
+    rng = random.Random(seed)
+    client = make_client()
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    local = defaultdict(list)
+    errors = defaultdict(int)
+    nbytes = defaultdict(int)
+    sent = 0
+
+    while time.perf_counter() < deadline:
+        if args.requests and sent >= args.requests:
+            break
+        sent += 1
+
+        name = rng.choices(names, weights)[0]
+        path = ROUTES[name].format(dev_eui=rng.choice(devices), limit=args.limit)
+
+        t0 = time.perf_counter()
+        try:
+            status, body = client.get(path)
+        except Exception as e:
+            status, body = None, b""
+            if args.verbose:
+                print(f"[LOAD] {name} {path}: {e}", file=sys.stderr)
+        elapsed = time.perf_counter() - t0
+
+        local[name].append(elapsed)
+        nbytes[name] += len(body)
+        # 404 pada latest/last10 berarti device tanpa data, bukan error server
+        if status not in (200, 404):
+            errors[name] += 1
+
+    results.append((local, errors, nbytes))
+
+
+def summarize(results, wall):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    nbytes = defaultdict(int)
+    for local, errs, nb in results:
+        for name, values in local.items():
+            latencies[name].extend(values)
+        for name, n in errs.items():
+            errors[name] += n
+        for name, n in nb.items():
+            nbytes[name] += n
+
+    report = {}
+    all_values = []
+    for name in sorted(latencies):
+        values = sorted(latencies[name])
+        all_values.extend(values)
+        report[name] = {
+            "count": len(values),
+            "errors": errors[name],
+            "rps": len(values) / wall,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": values[-1] * 1000,
+            "avg_bytes": nbytes[name] / len(values),
+        }
+
+    all_values.sort()
+    if all_values:
+        report["ALL"] = {
+            "count": len(all_values),
+            "errors": sum(errors.values()),
+            "rps": len(all_values) / wall,
+            "p50_ms": percentile(all_values, 50) * 1000,
+            "p95_ms": percentile(all_values, 95) * 1000,
+            "p99_ms": percentile(all_values, 99) * 1000,
+            "max_ms": all_values[-1] * 1000,
+            "avg_bytes": sum(nbytes.values()) / len(all_values),
+        }
+    return report
+
+
+def print_report(report, wall, concurrency):
+    print(f"\n[LOAD] durasi {wall:.1f}s, concurrency {concurrency}")
+    header = f"{'route':<12} {'count':>8} {'err':>6} {'req/s':>9} {'p50ms':>9} {'p95ms':>9} {'p99ms':>9} {'maxms':>9} {'bytes':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in report.items():
+        print(
+            f"{name:<12} {r['count']:>8} {r['errors']:>6} {r['rps']:>9.1f} "
+            f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} "
+            f"{r['max_ms']:>9.1f} {r['avg_bytes']:>9.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test endpoint uplink API")
+    parser.add_argument("--base-url", help="Target HTTP (default: in-process create_app())")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY"), help="X-API-Key (default: API_KEY dari env)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Jumlah worker thread")
+    parser.add_argument("--duration", type=float, default=30.0, help="Durasi test (detik)")
+    parser.add_argument("--requests", type=int, default=0, help="Batas request per worker (0 = tanpa batas)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Bobot route (default: {DEFAULT_MIX})")
+    parser.add_argument("--limit", type=int, default=50, help="limit/n untuk route list")
+    parser.add_argument("--device-sample", type=int, default=500, help="Jumlah device acak yang dipakai")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Timeout HTTP (detik)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed random generator")
+    parser.add_argument("--json", dest="json_out", help="Simpan hasil ke file JSON")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if not args.api_key:
+        parser.error("--api-key atau env API_KEY wajib diisi")
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.base_url:
+        def make_client():
+            return HttpClient(args.base_url, args.api_key, args.timeout)
+    else:
+        from flask_api import create_app
+
+        app = create_app()
+
+        def make_client():
+            return InProcessClient(app, args.api_key)
+
+    rng = random.Random(args.seed)
+    devices = discover_devices(make_client(), args.device_sample, rng)
+    print(f"[LOAD] {len(devices)} device, mix={mix}")
+
+    results = []
+    start = time.perf_counter()
+    deadline = start + args.duration
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(make_client, mix, devices, args, deadline, results, args.seed + i),
+            daemon=True,
+        )
+        for i in range(args.concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    report = summarize(results, wall)
+    print_report(report, wall, args.concurrency)
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({"duration_s": wall, "concurrency": args.concurrency, "routes": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
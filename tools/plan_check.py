@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# tools/plan_check.py
+"""
+Regression check query plan untuk SQL API (flask_api/routes.py).
+
+Setiap bentuk query route yang membaca iot.uplinks (pagination, offset dalam,
+filter waktu, latest, last N, full, filter field promosi, daftar device)
+dijalankan dengan EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) pada dataset hasil
+tools.seed_uplinks, lalu dicek:
+
+  - tidak ada Seq Scan pada iot.uplinks untuk route per device
+  - tidak ada Sort jika hasil yang cocok lebih banyak dari LIMIT (urutan harus
+    datang dari index); untuk window waktu sempit dan filter field, Sort atas
+    hasil kecil adalah plan yang wajar, jadi cukup dibatasi budget
+  - baris yang dibaca dari iot.uplinks dan shared buffers di bawah budget
+  - tidak ada spill ke temp file
+
+Route link stats tidak dicek: iot.device_link_stats hanya satu baris per device.
+
+--seed juga mengisi device untuk aplikasi di promoted_fields.json, supaya
+kolom promosi (mis. f_ldr) berisi nilai dan filter field diuji dengan plan nyata.
+
+Exit code 1 jika ada pelanggaran, jadi bisa dipasang di CI sebelum deploy.
+
+Contoh:
+  python -m tools.plan_check --seed            # seed dataset lalu cek
+  python -m tools.plan_check --prefix 5eed     # pakai data seed yang sudah ada
+"""
+import sys
+import json
+import argparse
+import subprocess
+from datetime import timedelta
+
+from flask_api import create_app
+from flask_api.fields import build_field_where_clause, get_promoted_fields
+from flask_api.routes import (
+    COMPACT_COLUMNS,
+    DEVICES_SQL,
+    FULL_COLUMNS,
+    build_ts_where_clause,
+    build_uplinks_sql,
+)
+
+from .common import connect_db
+
+SORT_NODES = ("Sort", "Incremental Sort")
+
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+def summarize_plan(plan):
+    """Ringkas output EXPLAIN JSON menjadi angka yang di-assert."""
+    root = plan["Plan"]
+    nodes = list(walk(root))
+    uplink_scans = [
+        n for n in nodes
+        if n.get("Relation Name") == "uplinks" and n.get("Schema", "iot") == "iot"
+    ]
+    rows_read = 0
+    for n in uplink_scans:
+        loops = n.get("Actual Loops", 1)
+        rows_read += (n.get("Actual Rows", 0) + n.get("Rows Removed by Filter", 0)) * loops
+    return {
+        "scans": sorted({
+            n["Node Type"] + (f" {n['Index Name']}" if n.get("Index Name") else "")
+            for n in uplink_scans
+        }),
+        "seq_scan": any(n["Node Type"] == "Seq Scan" for n in uplink_scans),
+        "sort": any(n["Node Type"] in SORT_NODES for n in nodes),
+        "rows_read": rows_read,
+        "buffers": root.get("Shared Hit Blocks", 0) + root.get("Shared Read Blocks", 0),
+        "temp_blocks": root.get("Temp Read Blocks", 0) + root.get("Temp Written Blocks", 0),
+        "time_ms": plan.get("Execution Time", 0.0),
+    }
+
+
+def check_shape(shape, summary):
+    errors = []
+    if shape.get("forbid_seq_scan", True) and summary["seq_scan"]:
+        errors.append("Seq Scan pada iot.uplinks")
+    if shape.get("forbid_sort", True) and summary["sort"]:
+        errors.append("Sort (index tidak memberi urutan)")
+    if shape.get("max_rows") is not None and summary["rows_read"] > shape["max_rows"]:
+        errors.append(f"rows_read {summary['rows_read']} > {shape['max_rows']}")
+    if shape.get("max_buffers") is not None and summary["buffers"] > shape["max_buffers"]:
+        errors.append(f"buffers {summary['buffers']} > {shape['max_buffers']}")
+    if summary["temp_blocks"]:
+        errors.append(f"spill ke temp file ({summary['temp_blocks']} blok)")
+    return errors
+
+
+def pick_device(cur, prefix, apps=None):
+    """Device seed pertama (opsional dari aplikasi tertentu): (dev_eui, jumlah uplink, ts min, ts max)."""
+    cur.execute(
+        """
+        SELECT UPPER(dev_eui), COUNT(*), MIN(ts), MAX(ts)
+        FROM iot.uplinks
+        WHERE UPPER(dev_eui) = (
+            SELECT UPPER(dev_eui) FROM iot.devices
+            WHERE dev_eui LIKE %s AND (%s::text[] IS NULL OR app_name = ANY(%s::text[]))
+            ORDER BY dev_eui LIMIT 1
+        )
+        GROUP BY UPPER(dev_eui)
+        """,
+        (prefix.lower() + "%", apps, apps),
+    )
+    return cur.fetchone()
+
+
+def field_filter_value(cur, field, dev_eui):
+    """(operator, nilai) yang realistis untuk filter field: ~5% teratas / nilai terbanyak."""
+    column = field["column"]  # sudah divalidasi _IDENT_RE di load_promoted_fields
+    if field["type"] == "numeric":
+        cur.execute(
+            f"""
+            SELECT percentile_disc(0.95) WITHIN GROUP (ORDER BY {column})
+            FROM iot.uplinks WHERE UPPER(dev_eui) = %s AND {column} IS NOT NULL
+            """,
+            (dev_eui,),
+        )
+        value = cur.fetchone()[0]
+        return ("gt", str(value)) if value is not None else None
+    cur.execute(
+        f"""
+        SELECT {column} FROM iot.uplinks
+        WHERE UPPER(dev_eui) = %s AND {column} IS NOT NULL
+        GROUP BY {column} ORDER BY COUNT(*) DESC LIMIT 1
+        """,
+        (dev_eui,),
+    )
+    row = cur.fetchone()
+    if row is None:
+        return None
+    value = row[0]
+    return "eq", str(value).lower() if isinstance(value, bool) else str(value)
+
+
+def count_matching(cur, where_clause, params):
+    cur.execute(f"SELECT COUNT(*) FROM iot.uplinks WHERE UPPER(dev_eui) = %s {where_clause}", params)
+    return cur.fetchone()[0]
+
+
+def build_shapes(app, cur, device, args):
+    """Semua bentuk query route, dengan budget dari jumlah baris yang seharusnya dibaca."""
+    dev_eui, count, min_ts, max_ts = device
+    limit = 500
+
+    def budget(expected):
+        # Index scan membaca ~1 heap page per baris (data antar device berselang-seling)
+        return {
+            "max_rows": int(expected * args.slack) + 10,
+            "max_buffers": int(expected * args.slack) + 50,
+        }
+
+    compact = ", ".join(COMPACT_COLUMNS)
+    full = ", ".join(FULL_COLUMNS)
+    shapes = []
+
+    def add(name, sql, params, expected=None, **opts):
+        shape = {"name": name, "sql": sql, "params": params, **opts}
+        if expected is not None:
+            shape.update(budget(expected))
+        shapes.append(shape)
+
+    add("list_compact", build_uplinks_sql(compact), [dev_eui, 50, 0], expected=50)
+    add("list_compact_offset", build_uplinks_sql(compact), [dev_eui, 50, 1000], expected=min(count, 1050))
+    add("list_full", build_uplinks_sql(full), [dev_eui, limit, 0], expected=min(count, limit))
+
+    # Filter waktu, window di tengah rentang data:
+    #  - lebar: berisi >= 2x LIMIT baris -> harus index scan terurut yang berhenti di LIMIT
+    #  - sempit (--window-hours): bisa lebih sedikit dari LIMIT -> Sort boleh, baris dibatasi isi window
+    span = max_ts - min_ts
+    per_second = count / max(span.total_seconds(), 1)
+    wide = timedelta(seconds=2 * limit / per_second)
+    narrow = timedelta(hours=args.window_hours)
+    windows = [("time", wide, True), ("time_narrow", narrow, False)]
+    for suffix, window, ordered in windows:
+        window = min(window, span)
+        ts_from = min_ts + (span - window) / 2
+        params = [dev_eui]
+        where_clause = build_ts_where_clause(ts_from.isoformat(), (ts_from + window).isoformat(), params)
+        matching = count_matching(cur, where_clause, params)
+        if ordered and matching <= limit:
+            print(f"[PLAN] Lewati list_*_{suffix}: hanya {matching} baris dalam window (data kurang)")
+            continue
+        params.extend([limit, 0])
+        for name, columns in (("list_compact", compact), ("list_full", full)):
+            add(
+                f"{name}_{suffix}", build_uplinks_sql(columns, where_clause), list(params),
+                expected=min(matching, limit) if ordered else matching, forbid_sort=ordered,
+            )
+
+    add("latest", build_uplinks_sql(compact, limit_clause="LIMIT 1"), [dev_eui], expected=1)
+    add("latest_full", build_uplinks_sql(full, limit_clause="LIMIT 1"), [dev_eui], expected=1)
+    add("last10", build_uplinks_sql(compact, limit_clause="LIMIT %s"), [dev_eui, 10], expected=10)
+    add("last500", build_uplinks_sql(compact, limit_clause="LIMIT %s"), [dev_eui, 500], expected=min(count, 500))
+
+    # Filter field promosi, hanya jika kolomnya sudah dibuat (tools.promote_fields --apply)
+    # dan ada device seed di aplikasi field tersebut (--seed)
+    with app.app_context():
+        promoted = get_promoted_fields()
+    for field in promoted.values():
+        if field["column"] not in args.existing_columns:
+            print(f"[PLAN] Lewati filter field {field['name']}: kolom {field['column']} belum ada")
+            continue
+        field_device = pick_device(cur, args.prefix, field["apps"] or None)
+        filt = field_filter_value(cur, field, field_device[0]) if field_device else None
+        if filt is None:
+            print(
+                f"[PLAN] Lewati filter field {field['name']}: tidak ada data seed untuk aplikasi "
+                f"{', '.join(field['apps']) or '-'} (jalankan dengan --seed)"
+            )
+            continue
+        op, value = filt
+        with app.test_request_context(query_string={"field": field["name"], op: value}):
+            params = [field_device[0]]
+            where_clause = build_field_where_clause(params)
+        matching = count_matching(cur, where_clause, params)
+        params.extend([50, 0])
+        # Dua plan wajar: jalan di index ts sambil filter (~50 * total / cocok baris),
+        # atau index (dev_eui, kolom) lalu Sort (semua baris cocok). Budget = yang terbesar.
+        expected = min(field_device[1], max(matching, 50 * field_device[1] // max(matching, 1)))
+        add(
+            f"field_{field['name']}", build_uplinks_sql(compact, where_clause), params,
+            expected=expected, forbid_sort=False,
+        )
+
+    # Daftar device memang agregasi seluruh tabel: cukup pastikan tidak spill ke disk
+    add("devices", DEVICES_SQL, [], forbid_seq_scan=False, forbid_sort=False)
+    return shapes
+
+
+def explain(cur, sql, params):
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regression check query plan SQL API")
+    parser.add_argument("--dsn", help="DSN PostgreSQL (default: DB_* dari .env)")
+    parser.add_argument("--prefix", default="5eed", help="Prefix dev_eui data seed")
+    parser.add_argument("--seed", action="store_true", help="Jalankan tools.seed_uplinks --replace dulu")
+    parser.add_argument("--seed-devices", type=int, default=200, help="Jumlah device saat --seed")
+    parser.add_argument("--seed-days", type=float, default=7.0, help="Rentang hari saat --seed")
+    parser.add_argument("--window-hours", type=float, default=6.0, help="Lebar window sempit filter waktu")
+    parser.add_argument("--slack", type=float, default=1.5, help="Pengali budget rows/buffers")
+    parser.add_argument("--show-plan", action="store_true", help="Cetak plan JSON untuk shape yang gagal")
+    args = parser.parse_args()
+
+    app = create_app()
+
+    if args.seed:
+        # Aplikasi biasa + aplikasi dari promoted_fields.json (device dibagi rata)
+        with app.app_context():
+            promoted_apps = [a for f in get_promoted_fields().values() for a in f["apps"]]
+        app_names = list(dict.fromkeys(["LoadTestApp1"] + promoted_apps))
+        cmd = [
+            sys.executable, "-m", "tools.seed_uplinks",
+            "--prefix", args.prefix,
+            "--devices", str(args.seed_devices),
+            "--days", str(args.seed_days),
+            "--app-names", ",".join(app_names),
+            "--replace",
+        ]
+        if args.dsn:
+            cmd += ["--dsn", args.dsn]
+        print(f"[PLAN] {' '.join(cmd[1:])}")
+        subprocess.run(cmd, check=True)
+
+    conn = connect_db(args.dsn)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = 'iot' AND table_name = 'uplinks'
+        """
+    )
+    args.existing_columns = {r[0] for r in cur.fetchall()}
+
+    device = pick_device(cur, args.prefix)
+    if device is None or device[1] < 1100:
+        raise SystemExit(
+            f"[PLAN] Data seed prefix {args.prefix!r} kurang (butuh >= 1100 uplink per device). "
+            "Jalankan dengan --seed."
+        )
+    print(f"[PLAN] Device {device[0]}: {device[1]:,} uplink")
+
+    shapes = build_shapes(app, cur, device, args)
+
+    # EXPLAIN ANALYZE benar-benar mengeksekusi query: jalankan read-only dan rollback
+    conn.rollback()
+    conn.set_session(readonly=True)
+    failures = 0
+    print(f"{'shape':<22} {'rows':>8} {'buffers':>8} {'ms':>8}  scan")
+    for shape in shapes:
+        plan = explain(cur, shape["sql"], shape["params"])
+        summary = summarize_plan(plan)
+        errors = check_shape(shape, summary)
+        scans = ", ".join(summary["scans"]) or "-"
+        print(
+            f"{shape['name']:<22} {summary['rows_read']:>8} {summary['buffers']:>8} "
+            f"{summary['time_ms']:>8.2f}  {scans}"
+        )
+        for error in errors:
+            print(f"    FAIL: {error}")
+        if errors:
+            failures += 1
+            if args.show_plan:
+                print(json.dumps(plan["Plan"], indent=2))
+    conn.rollback()
+    cur.close()
+    conn.close()
+
+    if failures:
+        print(f"[PLAN] {failures} dari {len(shapes)} shape gagal")
+        sys.exit(1)
+    print(f"[PLAN] Semua {len(shapes)} shape OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# tools/promote_fields.py
+"""
+Buat generated column + index untuk field data_json di promoted_fields.json.
+
+Default hanya mencetak DDL. Dengan --apply DDL dijalankan (autocommit, karena
+CREATE INDEX CONCURRENTLY tidak boleh di dalam transaksi).
+
+Catatan: ADD COLUMN ... GENERATED ... STORED menulis ulang iot.uplinks dan
+memegang lock eksklusif selama proses; jalankan di jam sepi untuk tabel besar.
+
+Contoh:
+  python -m tools.promote_fields
+  python -m tools.promote_fields --apply
+"""
+import time
+import argparse
+
+from flask_api.config import Config
+from flask_api.fields import field_ddl, load_promoted_fields
+
+from .common import connect_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DDL kolom promosi data_json")
+    parser.add_argument("--config", default=Config.PROMOTED_FIELDS_FILE, help="File konfigurasi field")
+    parser.add_argument("--dsn", help="DSN PostgreSQL (default: DB_* dari .env)")
+    parser.add_argument("--apply", action="store_true", help="Jalankan DDL ke database")
+    args = parser.parse_args()
+
+    fields = load_promoted_fields(args.config)
+    if not fields:
+        raise SystemExit(f"[PROMOTE] Tidak ada field di {args.config}")
+
+    statements = []
+    for field in fields.values():
+        statements.extend(field_ddl(field))
+    statements.append("ANALYZE iot.uplinks")
+
+    if not args.apply:
+        for stmt in statements:
+            print(stmt + ";\n")
+        return
+
+    conn = connect_db(args.dsn)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        for stmt in statements:
+            print(f"[PROMOTE] {stmt}")
+            t0 = time.perf_counter()
+            cur.execute(stmt)
+            print(f"[PROMOTE]   selesai dalam {time.perf_counter() - t0:.1f}s")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# tools/redecode_uplinks.py
+"""
+Re-decode data_text / data_json di iot.uplinks setelah decode_data_fields
+di ingestor diperbaiki.
+
+Tabel dibaca per rentang uplink_id (keyset, bukan OFFSET), payload di-decode
+ulang dari raw.data + raw.data_encode (fallback: data_hex) di process pool,
+dan hanya baris yang hasilnya berubah ditulis lewat UPDATE ... FROM (VALUES ...).
+Menjalankan ulang job ini aman: baris yang sudah benar tidak disentuh.
+
+Progress (uplink_id terakhir yang sudah di-commit) disimpan di file checkpoint.
+
+Contoh:
+  python -m tools.redecode_uplinks --workers 4 --max-rows-per-sec 20000 --max-active 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from collections import deque
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+
+from .common import connect_db, load_ingestor
+
+_ingestor = None
+
+FETCH_SQL = """
+    SELECT
+        uplink_id,
+        data_hex,
+        data_text,
+        data_json,
+        raw->>'data' AS raw_data,
+        raw->>'data_encode' AS raw_encode
+    FROM iot.uplinks
+    WHERE uplink_id > %s
+      AND (%s::bigint IS NULL OR uplink_id <= %s::bigint)
+    ORDER BY uplink_id
+    LIMIT %s
+"""
+
+UPDATE_SQL = """
+    UPDATE iot.uplinks AS u
+    SET
+        data_text = v.data_text,
+        data_json = v.data_json::jsonb
+    FROM (VALUES %s) AS v(uplink_id, data_text, data_json)
+    WHERE u.uplink_id = v.uplink_id
+      AND (u.data_text IS DISTINCT FROM v.data_text
+           OR u.data_json IS DISTINCT FROM v.data_json::jsonb)
+"""
+
+
+def _get_ingestor():
+    global _ingestor
+    if _ingestor is None:
+        _ingestor = load_ingestor()
+    return _ingestor
+
+
+def redecode_batch(rows):
+    """Worker: kembalikan [(uplink_id, data_text, data_json_str)] yang berubah."""
+    ing = _get_ingestor()
+    changed = []
+    for uplink_id, data_hex, old_text, old_json, raw_data, raw_encode in rows:
+        if raw_data:
+            _, new_text, new_json = ing.decode_data_fields(raw_data, raw_encode)
+        elif data_hex:
+            _, new_text, new_json = ing.decode_data_fields(data_hex, "hexstring")
+        else:
+            continue
+
+        if new_text == old_text and new_json == old_json:
+            continue
+        changed.append((
+            uplink_id,
+            new_text,
+            json.dumps(new_json) if new_json is not None else None,
+        ))
+    return changed
+
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get("last_uplink_id")
+
+
+def save_checkpoint(path, last_id):
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"updated_at": datetime.now().isoformat(), "last_uplink_id": last_id}, f)
+    os.replace(tmp, path)
+
+
+def wait_for_db_load(cur, max_active, poll_s=1.0):
+    """Tahan job selama jumlah backend aktif (selain kita) di atas max_active."""
+    if not max_active:
+        return
+    announced = False
+    while True:
+        cur.execute(
+            """
+            SELECT COUNT(*) FROM pg_stat_activity
+            WHERE state = 'active' AND pid <> pg_backend_pid()
+            """
+        )
+        active = cur.fetchone()[0]
+        if active <= max_active:
+            return
+        if not announced:
+            print(f"[REDECODE] DB sibuk ({active} query aktif > {max_active}), menunggu ...")
+            announced = True
+        time.sleep(poll_s)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-decode data_text/data_json di iot.uplinks")
+    parser.add_argument("--dsn", help="DSN PostgreSQL (default: DB_* dari .env)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Jumlah proses decoder")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Baris per batch keyset")
+    parser.add_argument("--from-id", type=int, default=0, help="Mulai setelah uplink_id ini")
+    parser.add_argument("--to-id", type=int, help="Berhenti di uplink_id ini (inklusif)")
+    parser.add_argument("--max-rows-per-sec", type=float, default=0, help="Batas laju baca (0 = tanpa batas)")
+    parser.add_argument("--max-active", type=int, default=0, help="Tunggu jika query aktif di DB melebihi ini (0 = nonaktif)")
+    parser.add_argument("--pause-ms", type=int, default=0, help="Jeda tambahan antar batch")
+    parser.add_argument("--checkpoint", default=".redecode-checkpoint.json", help="File checkpoint ('' = nonaktif)")
+    parser.add_argument("--restart", action="store_true", help="Abaikan checkpoint lama")
+    parser.add_argument("--dry-run", action="store_true", help="Hitung perubahan tanpa UPDATE")
+    args = parser.parse_args()
+
+    last_id = args.from_id
+    if not args.restart:
+        saved = load_checkpoint(args.checkpoint)
+        if saved is not None and saved > last_id:
+            last_id = saved
+            print(f"[REDECODE] Lanjut dari checkpoint uplink_id > {last_id}")
+
+    read_conn = connect_db(args.dsn)
+    read_conn.autocommit = True
+    write_conn = connect_db(args.dsn)
+    write_conn.autocommit = False
+    read_cur = read_conn.cursor()
+
+    ctx = multiprocessing.get_context("fork" if sys.platform != "win32" else "spawn")
+    inflight = deque()
+    exhausted = False
+    scanned = updated = 0
+    t0 = time.perf_counter()
+
+    try:
+        with ctx.Pool(args.workers) as pool:
+            while True:
+                wait_for_db_load(read_cur, args.max_active)
+
+                # Baca maju beberapa batch supaya semua worker tetap sibuk
+                while not exhausted and len(inflight) < args.workers * 2:
+                    read_cur.execute(FETCH_SQL, (last_id, args.to_id, args.to_id, args.batch_size))
+                    rows = read_cur.fetchall()
+                    if not rows:
+                        exhausted = True
+                        break
+                    last_id = rows[-1][0]
+                    inflight.append((last_id, len(rows), pool.apply_async(redecode_batch, (rows,))))
+
+                if not inflight:
+                    break
+
+                batch_last_id, n_rows, result = inflight.popleft()
+                changed = result.get()
+
+                if changed and not args.dry_run:
+                    with write_conn.cursor() as cur:
+                        execute_values(
+                            cur,
+                            UPDATE_SQL,
+                            changed,
+                            template="(%s::bigint, %s::text, %s::text)",
+                            page_size=len(changed),
+                        )
+                        updated += cur.rowcount
+                    write_conn.commit()
+                elif args.dry_run:
+                    updated += len(changed)
+
+                scanned += n_rows
+                if not args.dry_run:
+                    save_checkpoint(args.checkpoint, batch_last_id)
+
+                elapsed = time.perf_counter() - t0
+                print(
+                    f"[REDECODE] uplink_id <= {batch_last_id}: {scanned:,} dibaca, "
+                    f"{updated:,} {'akan ' if args.dry_run else ''}diperbarui, {scanned / elapsed:,.0f} rows/s"
+                )
+
+                # Throttle: laju baca rata-rata tidak melebihi --max-rows-per-sec
+                if args.max_rows_per_sec:
+                    ahead = scanned / args.max_rows_per_sec - (time.perf_counter() - t0)
+                    if ahead > 0:
+                        time.sleep(ahead)
+                if args.pause_ms:
+                    time.sleep(args.pause_ms / 1000.0)
+    finally:
+        read_cur.close()
+        read_conn.close()
+        write_conn.close()
+
+    elapsed = time.perf_counter() - t0
+    print(f"[REDECODE] Selesai dalam {elapsed:.1f}s: {scanned:,} dibaca, {updated:,} diperbarui")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# tools/seed_uplinks.py
+"""
+Generator dataset sintetis iot.applications / iot.devices / iot.uplinks
+untuk load test API. Data dimuat lewat COPY (bukan INSERT per baris),
+jadi 10M+ baris bisa dimuat dalam hitungan menit.
+
+Contoh (2000 device, 1 uplink/menit, 7 hari ~= 20M baris):
+  python -m tools.seed_uplinks --devices 2000 --interval 60 --days 7
+
+Semua dev_eui diawali --prefix (default "5eed") supaya data sintetis mudah
+dibersihkan lagi dengan --replace.
+"""
+import json
+import time
+import random
+import argparse
+import itertools
+from datetime import datetime, timezone, timedelta
+
+from .common import Counted, connect_db, copy_rows
+
+# WIB timezone (GMT+7), sama dengan ingestor
+WIB_TZ = timezone(timedelta(hours=7))
+
+UPLINK_COLUMNS = (
+    "app_id",
+    "app_name",
+    "dev_eui",
+    "device_name",
+    "ts",
+    "inserted_at",
+    "fcnt",
+    "fport",
+    "data_hex",
+    "data_text",
+    "data_json",
+    "rssi_dbm",
+    "snr_db",
+    "dr",
+    "freq_hz",
+    "raw",
+)
+
+DEVICE_COLUMNS = ("dev_eui", "app_name", "device_name", "first_seen", "last_seen")
+
+FREQUENCIES_HZ = (921400000, 921600000, 921800000, 922000000, 922200000)
+
+
+def build_devices(args):
+    devices = []
+    for i in range(args.devices):
+        app_idx = i % args.apps
+        devices.append({
+            "dev_eui": f"{args.prefix}{i:0{16 - len(args.prefix)}x}",
+            "app_id": str(app_idx + 1),
+            "app_name": args.app_names[app_idx] if args.app_names else f"{args.app_prefix}{app_idx + 1}",
+            "device_name": f"seed-{i:05d}",
+            "gateway_id": f"a840{i % args.gateways:012x}",
+        })
+    return devices
+
+
+def generate_uplinks(args, devices, start, rng):
+    """
+    Uplink disusun per langkah waktu (semua device di langkah k, lalu k+1, ...)
+    sehingga urutan fisik tabel mendekati urutan ts seperti data produksi.
+    """
+    steps = int(args.days * 86400 // args.interval)
+    phases = [rng.uniform(0, args.interval) for _ in devices]
+    fcnts = [0] * len(devices)
+
+    for step in range(steps):
+        base = start + timedelta(seconds=step * args.interval)
+        for idx, dev in enumerate(devices):
+            fcnt = fcnts[idx]
+            fcnts[idx] += 1
+            if args.loss and rng.random() < args.loss:
+                continue
+
+            ts = base + timedelta(seconds=phases[idx] + rng.uniform(-1, 1))
+            inserted_at = ts + timedelta(milliseconds=rng.randint(50, 800))
+
+            data_obj = {"data": {"LDR": rng.randint(0, 1023), "LED": str(rng.randint(0, 1))}}
+            data_text = json.dumps(data_obj, separators=(",", ":"))
+            data_hex = data_text.encode("utf-8").hex().upper()
+
+            rssi = rng.randint(-125, -60)
+            snr = round(rng.uniform(-15.0, 12.0), 1)
+            dr = rng.randint(0, 5)
+            freq = rng.choice(FREQUENCIES_HZ)
+
+            raw = {
+                "applicationID": dev["app_id"],
+                "applicationName": dev["app_name"],
+                "devEUI": dev["dev_eui"],
+                "deviceName": dev["device_name"],
+                "timestamp": int(ts.timestamp()),
+                "fCnt": fcnt,
+                "fPort": 1,
+                "data": data_hex,
+                "data_encode": "hexstring",
+                "rxInfo": [{
+                    "gatewayID": dev["gateway_id"],
+                    "time": ts.astimezone(timezone.utc).isoformat().replace("+00:00", "Z"),
+                    "rssi": rssi,
+                    "loRaSNR": snr,
+                }],
+                "txInfo": {"frequency": freq, "dr": dr},
+            }
+
+            yield (
+                dev["app_id"],
+                dev["app_name"],
+                dev["dev_eui"],
+                dev["device_name"],
+                ts.isoformat(),
+                inserted_at.isoformat(),
+                fcnt,
+                1,
+                data_hex,
+                data_text,
+                data_text,
+                rssi,
+                snr,
+                dr,
+                freq,
+                json.dumps(raw, separators=(",", ":")),
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed dataset uplink sintetis via COPY")
+    parser.add_argument("--dsn", help="DSN PostgreSQL (default: DB_* dari .env)")
+    parser.add_argument("--devices", type=int, default=1000, help="Jumlah device")
+    parser.add_argument("--apps", type=int, default=5, help="Jumlah aplikasi")
+    parser.add_argument("--gateways", type=int, default=20, help="Jumlah gateway")
+    parser.add_argument("--interval", type=float, default=60.0, help="Detik antar uplink per device")
+    parser.add_argument("--days", type=float, default=7.0, help="Rentang waktu data (hari)")
+    parser.add_argument("--loss", type=float, default=0.01, help="Probabilitas paket hilang (gap fCnt)")
+    parser.add_argument("--prefix", default="5eed", help="Prefix hex dev_eui data sintetis")
+    parser.add_argument("--app-prefix", default="LoadTestApp", help="Prefix nama aplikasi")
+    parser.add_argument("--app-names", help="Nama aplikasi dipisah koma (menggantikan --apps/--app-prefix)")
+    parser.add_argument("--batch-rows", type=int, default=500000, help="Baris per COPY/commit")
+    parser.add_argument("--seed", type=int, default=42, help="Seed random generator")
+    parser.add_argument("--replace", action="store_true", help="Hapus data dengan prefix yang sama dulu")
+    parser.add_argument("--no-analyze", action="store_true", help="Lewati ANALYZE setelah load")
+    args = parser.parse_args()
+
+    if len(args.prefix) > 8:
+        parser.error("--prefix maksimal 8 karakter hex")
+    try:
+        int(args.prefix, 16)
+    except ValueError:
+        parser.error("--prefix harus hex")
+    args.prefix = args.prefix.lower()
+    if args.app_names:
+        args.app_names = [n.strip() for n in args.app_names.split(",") if n.strip()]
+        args.apps = len(args.app_names)
+
+    rng = random.Random(args.seed)
+    devices = build_devices(args)
+    end = datetime.now(WIB_TZ).replace(microsecond=0)
+    start = end - timedelta(days=args.days)
+    expected_rows = int(args.days * 86400 // args.interval) * len(devices)
+
+    conn = connect_db(args.dsn)
+    conn.autocommit = False
+    cur = conn.cursor()
+
+    like = args.prefix + "%"
+    cur.execute("SELECT COUNT(*) FROM iot.devices WHERE dev_eui LIKE %s", (like,))
+    existing = cur.fetchone()[0]
+    if existing and not args.replace:
+        raise SystemExit(
+            f"[SEED] {existing} device dengan prefix {args.prefix!r} sudah ada. "
+            "Pakai --replace atau --prefix lain."
+        )
+    if existing:
+        print(f"[SEED] Menghapus data lama prefix {args.prefix!r} ...")
+        cur.execute("DELETE FROM iot.uplinks WHERE dev_eui LIKE %s", (like,))
+        cur.execute("DELETE FROM iot.devices WHERE dev_eui LIKE %s", (like,))
+        conn.commit()
+
+    app_names = sorted({d["app_name"] for d in devices})
+    for app_name in app_names:
+        cur.execute(
+            "INSERT INTO iot.applications (app_name) VALUES (%s) ON CONFLICT (app_name) DO NOTHING",
+            (app_name,),
+        )
+    copy_rows(
+        cur,
+        "iot.devices",
+        DEVICE_COLUMNS,
+        ((d["dev_eui"], d["app_name"], d["device_name"], start.isoformat(), end.isoformat()) for d in devices),
+    )
+    conn.commit()
+    print(f"[SEED] {len(app_names)} aplikasi, {len(devices)} device")
+
+    print(f"[SEED] Memuat ~{expected_rows:,} uplink ({args.days} hari, interval {args.interval}s) ...")
+    rows = generate_uplinks(args, devices, start, rng)
+    t0 = time.perf_counter()
+    loaded = 0
+    while True:
+        batch = Counted(itertools.islice(rows, args.batch_rows))
+        copy_rows(cur, "iot.uplinks", UPLINK_COLUMNS, batch)
+        conn.commit()
+        if not batch.n:
+            break
+        loaded += batch.n
+        elapsed = time.perf_counter() - t0
+        print(f"[SEED] {loaded:,} baris, {loaded / elapsed:,.0f} rows/s")
+
+    if not args.no_analyze:
+        print("[SEED] ANALYZE ...")
+        cur.execute("ANALYZE iot.uplinks")
+        cur.execute("ANALYZE iot.devices")
+        conn.commit()
+
+    cur.close()
+    conn.close()
+    elapsed = time.perf_counter() - t0
+    print(f"[SEED] Selesai: {loaded:,} uplink dalam {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()